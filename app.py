@@ -3,13 +3,18 @@ Flask application for Financial Sankey Diagram Generator
 Integrates vnstock for Vietnamese stock market data
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import traceback
+import json
 import os
 
 # Import our modules
-from data_fetcher import fetch_balance_sheet, fetch_income_statement, fetch_cash_flow
+from data_fetcher import fetch_balance_sheet, fetch_income_statement, fetch_cash_flow, STATEMENT_CACHE, CLIENT_POOL, SESSION_POOL, SOURCE_STATS
+from cache import cached_extract, FLOW_CACHE
+from flow_utils import prune_flows, parse_flow_options
+from profiling import profiled, stream_profile
 import balance
 import cashflow
 import income
@@ -17,6 +22,33 @@ import income
 app = Flask(__name__)
 CORS(app)
 
+# report_type -> (fetch function, extractor module)
+REPORTS = {
+    'balance': (fetch_balance_sheet, balance),
+    'income': (fetch_income_statement, income),
+    'cashflow': (fetch_cash_flow, cashflow),
+}
+
+
+def build_report(report_type, symbol, period, year, extract_params, max_flows):
+    """Fetch one statement and turn it into pruned Sankey text; returns (flows, actual_period)"""
+    fetch, module = REPORTS[report_type]
+    df, actual_period = fetch(symbol, period, year)
+    return prune_flows(cached_extract(module, df, **extract_params), max_flows), actual_period
+
+
+def parse_all_reports_request(data):
+    """Validate an all-reports payload; returns (symbol, period, year, extract_params, max_flows, unit)"""
+    if not data:
+        raise ValueError('No data provided')
+    symbol = data.get('symbol', '').strip().upper()
+    period = data.get('period', '').strip()
+    year = data.get('year')
+    if not symbol or not period or not year:
+        raise ValueError('Missing required parameters')
+    extract_params, max_flows, unit = parse_flow_options(data)
+    return symbol, period, year, extract_params, max_flows, unit
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -24,6 +56,7 @@ def index():
 
 
 @app.route('/api/generate-sankey', methods=['POST'])
+@profiled
 def generate_sankey():
     """
     Generate Sankey diagram data from vnstock
@@ -33,7 +66,10 @@ def generate_sankey():
         "symbol": "VNM",
         "report_type": "balance",  // or "income", "cashflow"
         "period": "Q1",  // or "Q2", "Q3", "Q4", "year"
-        "year": 2024
+        "year": 2024,
+        "threshold": 0.01,  // optional, see parse_flow_options
+        "unit": "billion",  // optional, or "million"
+        "max_flows_per_node": 8  // optional
     }
     
     Returns:
@@ -43,7 +79,8 @@ def generate_sankey():
         "symbol": "VNM",
         "report_type": "balance",
         "period": "Q1",
-        "year": 2024
+        "year": 2024,
+        "unit": "billion"
     }
     """
     try:
@@ -90,22 +127,17 @@ def generate_sankey():
                 'error': 'Invalid year. Must be between 2000 and 2030'
             }), 400
         
-        # Fetch data from vnstock
-        if report_type == 'balance':
-            df, actual_period = fetch_balance_sheet(symbol, period, year)
-            sankey_data = balance.extract_flows_from_dataframe(df)
-        elif report_type == 'income':
-            df, actual_period = fetch_income_statement(symbol, period, year)
-            sankey_data = income.extract_flows_from_dataframe(df)
-        elif report_type == 'cashflow':
-            df, actual_period = fetch_cash_flow(symbol, period, year)
-            sankey_data = cashflow.extract_flows_from_dataframe(df)
-        else:
+        try:
+            extract_params, max_flows, unit = parse_flow_options(data)
+        except (ValueError, TypeError) as e:
             return jsonify({
                 'success': False,
-                'error': 'Unknown report type'
+                'error': str(e)
             }), 400
         
+        # Fetch data from vnstock (raw statements and extraction results are cached)
+        sankey_data, actual_period = build_report(report_type, symbol, period, year, extract_params, max_flows)
+        
         # Check if we got valid data
         if not sankey_data or sankey_data.startswith('// Error'):
             return jsonify({
@@ -121,6 +153,7 @@ def generate_sankey():
             'report_type': report_type,
             'period': period,
             'year': year,
+            'unit': unit,
             'actual_period': actual_period
         })
         
@@ -136,49 +169,25 @@ def generate_sankey():
 
 
 @app.route('/api/generate-all-reports', methods=['POST'])
+@profiled
 def generate_all_reports():
     """
     Generate all 3 Sankey diagrams data from vnstock
     """
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'success': False, 'error': 'No data provided'}), 400
-        
-        symbol = data.get('symbol', '').strip().upper()
-        period = data.get('period', '').strip()
-        year = data.get('year')
-        
-        if not symbol or not period or not year:
-            return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
+        try:
+            symbol, period, year, extract_params, max_flows, unit = parse_all_reports_request(request.get_json())
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         results = {}
-        
         actual_periods = {}
-        
-        # 1. Balance Sheet
-        try:
-            df_balance, ap_balance = fetch_balance_sheet(symbol, period, year)
-            results['balance'] = balance.extract_flows_from_dataframe(df_balance)
-            actual_periods['balance'] = ap_balance
-        except Exception as e:
-            results['balance'] = f"// Error: {str(e)}"
-
-        # 2. Income Statement
-        try:
-            df_income, ap_income = fetch_income_statement(symbol, period, year)
-            results['income'] = income.extract_flows_from_dataframe(df_income)
-            actual_periods['income'] = ap_income
-        except Exception as e:
-            results['income'] = f"// Error: {str(e)}"
-
-        # 3. Cash Flow
-        try:
-            df_cashflow, ap_cashflow = fetch_cash_flow(symbol, period, year)
-            results['cashflow'] = cashflow.extract_flows_from_dataframe(df_cashflow)
-            actual_periods['cashflow'] = ap_cashflow
-        except Exception as e:
-            results['cashflow'] = f"// Error: {str(e)}"
+        for report_type in REPORTS:
+            try:
+                results[report_type], actual_periods[report_type] = build_report(
+                    report_type, symbol, period, year, extract_params, max_flows)
+            except Exception as e:
+                results[report_type] = f"// Error: {str(e)}"
             
         return jsonify({
             'success': True,
@@ -186,6 +195,7 @@ def generate_all_reports():
             'symbol': symbol,
             'period': period,
             'year': year,
+            'unit': unit,
             'actual_periods': actual_periods
         })
         
@@ -195,12 +205,91 @@ def generate_all_reports():
         return jsonify({'success': False, 'error': f'Server error: {str(e)}'}), 500
 
 
+@app.route('/api/generate-all-reports/stream', methods=['POST'])
+def generate_all_reports_stream():
+    """
+    Streaming variant of /api/generate-all-reports (Server-Sent Events)
+
+    Same payload. The three reports are fetched and extracted concurrently and each
+    one is sent as soon as it is ready:
+
+        event: report
+        data: {"report_type": "income", "data": "...", "actual_period": "2024-Q3"}
+
+    followed by a final event with the common fields:
+
+        event: done
+        data: {"success": true, "symbol": "VNM", ..., "actual_periods": {...}}
+
+    The work runs while the response streams, so profiling (X-Profile) is done by
+    profiling.StreamProfile around the generator rather than by @profiled.
+    """
+    try:
+        symbol, period, year, extract_params, max_flows, unit = parse_all_reports_request(request.get_json())
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    profile = stream_profile()
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def build(report_type):
+        try:
+            return build_report(report_type, symbol, period, year, extract_params, max_flows)
+        except Exception as e:
+            return f"// Error: {str(e)}", None
+
+    def results():
+        """(report_type, (flows, actual_period)) in completion order"""
+        if profile and not profile.parallel:
+            for report_type in REPORTS:
+                yield report_type, build(report_type)
+            return
+        task = profile.wrap(build) if profile else build
+        with ThreadPoolExecutor(max_workers=len(REPORTS)) as pool:
+            futures = {pool.submit(task, report_type): report_type for report_type in REPORTS}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def generate():
+        actual_periods = {}
+        for report_type, (flows, actual_period) in results():
+            if actual_period is not None:
+                actual_periods[report_type] = actual_period
+            yield sse('report', {'report_type': report_type, 'data': flows, 'actual_period': actual_period})
+        yield sse('done', {
+            'success': True,
+            'symbol': symbol,
+            'period': period,
+            'year': year,
+            'unit': unit,
+            'actual_periods': actual_periods
+        })
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+    body = generate()
+    if profile:
+        body = profile.run(body)
+        headers['X-Profile-File'] = profile.filename
+    return Response(stream_with_context(body), mimetype='text/event-stream', headers=headers)
+
+
 @app.route('/api/health', methods=['GET'])
+@profiled
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'service': 'Financial Sankey Diagram Generator'
+        'service': 'Financial Sankey Diagram Generator',
+        'flow_cache': FLOW_CACHE.stats(),
+        'statement_cache': {**STATEMENT_CACHE.stats(), 'nbytes': sum(s.nbytes for s in STATEMENT_CACHE.values())},
+        'client_pool': CLIENT_POOL.stats(),
+        'http_sessions': SESSION_POOL.stats(),
+        'sources': SOURCE_STATS.stats()
     })
 
 
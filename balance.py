@@ -1,159 +1,227 @@
-import pandas as pd
+import math
 import os
-import re
 
-def normalize_text(text):
+from flow_utils import fold_small_flows
+from label_matcher import LabelMatcher
+from statement import as_statement
+
+# Tăng số này mỗi khi thay đổi logic trích xuất để làm mới cache kết quả (xem cache.py)
+EXTRACTOR_VERSION = 4
+
+# Ngưỡng hiển thị mặc định: 1% tổng tài sản
+THRESHOLD_PERCENT = 0.01
+# Chênh lệch VCSH nhỏ hơn 0.5% thì bỏ qua thay vì thêm luồng "Thông tin khác"
+PLUG_TOLERANCE = 0.005
+
+# Các chỉ tiêu cần trích xuất và tên đồng nghĩa (KBS / VCI)
+BALANCE_ITEMS = {
+    # Tài sản (Dùng tên chính xác hoặc chuẩn hóa)
+    "tong_tai_san": ["TỔNG CỘNG TÀI SẢN", "TỔNG CỘNG TÀI SẢN (đồng)"],
+    "tai_san_ngan_han": ["TÀI SẢN NGẮN HẠN", "TÀI SẢN NGẮN HẠN (đồng)"],
+    "tai_san_dai_han": ["TÀI SẢN DÀI HẠN", "TÀI SẢN DÀI HẠN (đồng)"],
+
+    # Chi tiết Tài sản ngắn hạn
+    "tien_va_cac_khoan_tuong_duong_tien": ["Tiền và các khoản tương đương tiền", "Tiền và tương đương tiền (đồng)"],
+    "dau_tu_tai_chinh_ngan_han": ["Đầu tư tài chính ngắn hạn", "Giá trị thuần đầu tư ngắn hạn (đồng)"],
+    "cac_khoan_phai_thu_ngan_han": ["Các khoản phải thu ngắn hạn", "Các khoản phải thu ngắn hạn (đồng)"],
+    "hang_ton_kho": ["Hàng tồn kho", "Hàng tồn kho ròng", "Hàng tồn kho, ròng (đồng)"],
+    "tai_san_ngan_han_khac": ["Tài sản ngắn hạn khác", "Tài sản lưu động khác"],
+
+    # Chi tiết Tài sản dài hạn
+    "tai_san_co_dinh": ["Tài sản cố định", "Tài sản cố định (đồng)"],
+    "tai_san_dai_han_khac": ["Tài sản dài hạn khác", "Tài sản dài hạn khác (đồng)"],
+    "cac_khoan_phai_thu_dai_han": ["Các khoản phải thu dài hạn", "Phải thu dài hạn (đồng)"],
+    "bat_dong_san_dau_tu": ["Bất động sản đầu tư", "Giá trị ròng tài sản đầu tư"],
+    "tai_san_do_dang_dai_han": ["Tài sản dở dang dài hạn", "Chi phí xây dựng cơ bản dở dang", "Chi phí xây dựng cơ bản dở dang (đồng)"],
+    "dau_tu_tai_chinh_dai_han": ["Đầu tư tài chính dài hạn", "Đầu tư dài hạn (đồng)"],
+    "loi_the_thuong_mai": ["Lợi thế thương mại", "Lợi thế thương mại (đồng)"],
+
+    # Nguồn vốn
+    "no_phai_tra": ["NỢ PHẢI TRẢ", "NỢ PHẢI TRẢ (đồng)"],
+    "von_chu_so_huu": ["VỐN CHỦ SỞ HỮU", "VỐN CHỦ SỞ HỮU (đồng)"],
+    "no_ngan_han": ["Nợ ngắn hạn", "Nợ ngắn hạn (đồng)"],
+    "no_dai_han": ["Nợ dài hạn", "Nợ dài hạn (đồng)"],
+
+    # Chi tiết Nợ ngắn hạn
+    "phai_tra_nguoi_ban_ngan_han": ["Phải trả người bán ngắn hạn", "Phải trả người bán", "Phải trả cho người bán"],
+    "nguoi_mua_tra_tien_truoc_ngan_han": ["Người mua trả tiền trước ngắn hạn", "Người mua trả tiền trước ngắn hạn (đồng)"],
+    "thue_va_cac_khoan_phai_nop_nha_nuoc": ["Thuế và các khoản phải nộp Nhà nước"],
+    "phai_tra_nguoi_lao_dong": ["Phải trả người lao động"],
+    "chi_phi_phai_tra_ngan_han": ["Chi phí phải trả ngắn hạn"],
+    "phai_tra_khac_ngan_han": ["Phải trả ngắn hạn khác"],
+    "vay_va_no_thue_tai_chinh_ngan_han": ["Vay và nợ thuê tài chính ngắn hạn", "Vay và nợ thuê tài chính ngắn hạn (đồng)"],
+    "quy_khen_thuong_phuc_loi": ["Quỹ khen thưởng, phúc lợi", "Quỹ khen thưởng phúc lợi", "Quỹ khen thưởng và phúc lợi"],
+    "du_phong_phai_tra_ngan_han": ["Dự phòng phải trả ngắn hạn"],
+
+    # Chi tiết Nợ dài hạn
+    "vay_va_no_thue_tai_chinh_dai_han": ["Vay và nợ thuê tài chính dài hạn", "Vay và nợ thuê tài chính dài hạn (đồng)"],
+    "phai_tra_nha_cung_cap_dai_han": ["Phải trả nhà cung cấp dài hạn", "Phải trả người bán dài hạn"],
+    "nguoi_mua_tra_tien_truoc_dai_han": ["Người mua trả tiền trước dài hạn"],
+    "chi_phi_phai_tra_dai_han": ["Chi phí phải trả dài hạn", "Chi phí phải trả dài hạn (đồng)"],
+    "phai_tra_noi_bo_von_kinh_doanh": ["Phải trả nội bộ về vốn kinh doanh"],
+    "phai_tra_noi_bo_dai_han": ["Phải trả nội bộ dài hạn"],
+    "doanh_thu_chua_thuc_hien_dai_han": ["Doanh thu chưa thực hiện dài hạn"],
+    "phai_tra_dai_han_khac": ["Phải trả dài hạn khác"],
+    "trai_phieu_chuyen_doi": ["Trái phiếu chuyển đổi"],
+    "co_phieu_uu_dai_no": ["Cổ phiếu ưu đãi (Nợ)"],
+    "thue_thu_nhap_hoan_lai_phai_tra": ["Thuế thu nhập hoãn lại phải trả"],
+    "du_phong_phai_tra_dai_han": ["Dự phòng phải trả dài hạn"],
+    "quy_phat_trien_khoa_hoc_cong_nghe": ["Quỹ phát triển khoa học và công nghệ"],
+    "du_phong_tro_cap_mat_viec": ["Dự phòng trợ cấp mất việc làm"],
+
+    # Chi tiết Vốn chủ sở hữu
+    "von_gop_chu_so_huu": ["Vốn góp của chủ sở hữu", "Vốn góp của chủ sở hữu (đồng)"],
+    "thang_du_von_co_phan": ["Thặng dư vốn cổ phần"],
+    "quyen_chon_chuyen_doi_trai_phieu": ["Quyền chọn chuyển đổi trái phiếu"],
+    "von_khac_chu_so_huu": ["Vốn khác của chủ sở hữu"],
+    "co_phieu_quy": ["Cổ phiếu quỹ"],
+    "chenh_lech_danh_gia_lai_tai_san": ["Chênh lệch đánh giá lại tài sản"],
+    "chenh_lech_ty_gia_hoi_doai": ["Chênh lệch tỷ giá hối đoái"],
+    "quy_dau_tu_phat_trien": ["Quỹ đầu tư phát triển", "Quỹ đầu tư và phát triển (đồng)"],
+    "quy_ho_tro_sap_xep_doanh_nghiep": ["Quỹ hỗ trợ sắp xếp doanh nghiệp"],
+    "quy_khac_thuoc_von_chu_so_huu": ["Quỹ khác thuộc vốn chủ sở hữu"],
+    "loi_nhuan_chua_phan_phoi": ["Lợi nhuận sau thuế chưa phân phối", "Lãi chưa phân phối (đồng)"],
+    "loi_ich_co_dong_khong_kiem_soat": ["Lợi ích cổ đông không kiểm soát", "Lợi ích của cổ đông thiểu số", "LỢI ÍCH CỦA CỔ ĐÔNG THIỂU SỐ"],
+    "nguon_kinh_phi_va_quy_khac": ["Nguồn kinh phí và quỹ khác"],
+}
+
+# Biên dịch toàn bộ tên đồng nghĩa một lần (xem label_matcher.py)
+_MATCHER = LabelMatcher(BALANCE_ITEMS)
+
+def _round_value(value, unit_factor, is_cost=False):
+    if not math.isnan(value):
+        # Giữ dấu để tính toán, chỉ lấy trị tuyệt đối khi hiển thị luồng
+        val_rounded = round(value / unit_factor)
+        return abs(val_rounded) if is_cost else val_rounded
+    return 0
+
+def extract_values(statement, column, unit_factor=1_000_000_000):
     """
-    Chuẩn hóa text để so sánh: bỏ số thứ tự, bỏ khoảng trắng dư, viết thường
-    Ví dụ: 'I. Tiền và các khoản tương đương tiền' -> 'tien va cac khoan tuong duong tien'
+    Trích xuất toàn bộ chỉ tiêu trong BALANCE_ITEMS bằng một lần quét nhãn.
+    statement: Statement (xem statement.py), column: tên kỳ
+    Trả về dict tên chỉ tiêu -> giá trị đã làm tròn (0 nếu không tìm thấy).
     """
-    if not isinstance(text, str):
-        return ""
-    # Bỏ các tiền tố như "I. ", "1. ", "A. ", "   - "
-    text = re.sub(r'^[A-Z0-9\.\s\-IXV]+[\.\s\-]+', '', text)
-    # Bỏ dấu ngoặc đơn và nội dung bên trong (thường là đơn vị hoặc chú thích)
-    text = re.sub(r'\s*\(.*\)', '', text)
-    # Bỏ khoảng trắng dư và chuyển về chữ thường
-    text = " ".join(text.split()).lower()
-    return text
+    rows = _MATCHER.match(statement.labels)
+    data = statement.column(column)
+    values = {}
+    for name, row in rows.items():
+        try:
+            values[name] = 0 if row is None else _round_value(data[row], unit_factor)
+        except Exception as e:
+            print(f"Lỗi khi trích xuất {BALANCE_ITEMS[name]}: {e}")
+            values[name] = 0
+    return values
 
 def safe_extract_value_and_round(df, chi_tieu_dao, column, unit_factor=1_000_000_000, is_cost=False):
     """
-    Trích xuất và làm tròn giá trị từ DataFrame bằng cách so sánh chuẩn hóa.
+    Trích xuất và làm tròn giá trị từ Statement/DataFrame bằng cách so sánh chuẩn hóa.
+    Dùng cho tra cứu lẻ; luồng chính dùng extract_values.
     """
     try:
-        if isinstance(chi_tieu_dao, str):
-            targets = [chi_tieu_dao]
-        else:
-            targets = chi_tieu_dao
-            
-        targets_norm = [normalize_text(t) for t in targets]
-        
-        df_temp = df.copy()
-        df_temp["NORM"] = df_temp["CHỈ TIÊU"].apply(normalize_text)
-        
-        row = df_temp.loc[df_temp["NORM"].isin(targets_norm)]
-        
-        if row.empty:
-            for t_norm in targets_norm:
-                # Find matches where target exists within the source line
-                row = df_temp[df_temp["NORM"].str.contains(t_norm, na=False)]
-                if not row.empty:
-                    # If multiple matches, prefer the one most similar in length (best fit)
-                    row = row.assign(len_diff=abs(row["NORM"].str.len() - len(t_norm))).sort_values("len_diff")
-                    break
-            
-        if row.empty:
+        statement = as_statement(df)
+        row = LabelMatcher({"item": chi_tieu_dao}).match(statement.labels)["item"]
+        if row is None:
             return 0
-            
-        value = row[column].iloc[0]
-        if pd.notna(value):
-            # Giữ dấu để tính toán, chỉ lấy trị tuyệt đối khi hiển thị luồng
-            val_rounded = round(value / unit_factor)
-            return abs(val_rounded) if is_cost else val_rounded
-        return 0
+        return _round_value(statement.column(str(column))[row], unit_factor, is_cost)
     except Exception as e:
         print(f"Lỗi khi trích xuất {chi_tieu_dao}: {e}")
         return 0
 
-def extract_flows_from_dataframe(df):
+def extract_flows_from_dataframe(df, threshold=None, unit_factor=1_000_000_000):
     """
-    Xử lý DataFrame và trả về chuỗi flows cho SankeyMATIC.
-    df: pandas DataFrame với cột đầu tiên là tên chỉ tiêu
+    Xử lý báo cáo và trả về chuỗi flows cho SankeyMATIC.
+    df: Statement (từ data_fetcher) hoặc pandas DataFrame với cột đầu tiên là tên chỉ tiêu
+    threshold: tỷ lệ so với tổng tài sản để lọc luồng nhỏ (mặc định THRESHOLD_PERCENT)
+    unit_factor: đơn vị hiển thị (1e9 = tỷ VND)
     """
     try:
-        # Đổi tên và làm sạch
-        if df.shape[1] < 2:
+        statement = as_statement(df)
+        if not statement.periods:
             return "// Error: DataFrame không đủ cột dữ liệu."
 
-        # Cột 0 là tên chỉ tiêu, Cột 1 là số liệu (Kỳ này/Năm nay...)
-        # Ta lấy tên cột đầu tiên gán lại cho dễ tham chiếu
-        first_col_name = df.columns[0]
-        df = df.rename(columns={first_col_name: "CHỈ TIÊU"})
-        df["CHỈ TIÊU"] = df["CHỈ TIÊU"].astype(str).str.strip()
-        df = df.dropna(how='all')
-
-        # Lấy tên cột số liệu (cột thứ 2)
-        first_numeric_column = df.columns[1]
+        # Kỳ đầu tiên là số liệu (Kỳ này/Năm nay...)
+        first_numeric_column = statement.periods[0]
 
         # --- EXTRACT DATA ---
-        return _extract_flows_logic(df, first_numeric_column)
+        return _extract_flows_logic(statement, first_numeric_column, threshold, unit_factor)
         
     except Exception as e:
         return f"// Error processing DataFrame: {str(e)}"
 
-def _extract_flows_logic(df, first_numeric_column):
+def _extract_flows_logic(statement, first_numeric_column, threshold=None, unit_factor=1_000_000_000):
     """
-    Core logic for extracting flows from DataFrame
+    Core logic for extracting flows from a Statement
     """
+    values = extract_values(statement, first_numeric_column, unit_factor)
+
     # Tài sản (Dùng tên chính xác hoặc chuẩn hóa)
-    tong_tai_san = safe_extract_value_and_round(df, ["TỔNG CỘNG TÀI SẢN", "TỔNG CỘNG TÀI SẢN (đồng)"], first_numeric_column)
-    tai_san_ngan_han = safe_extract_value_and_round(df, ["TÀI SẢN NGẮN HẠN", "TÀI SẢN NGẮN HẠN (đồng)"], first_numeric_column)
-    tai_san_dai_han = safe_extract_value_and_round(df, ["TÀI SẢN DÀI HẠN", "TÀI SẢN DÀI HẠN (đồng)"], first_numeric_column)
+    tong_tai_san = values["tong_tai_san"]
+    tai_san_ngan_han = values["tai_san_ngan_han"]
+    tai_san_dai_han = values["tai_san_dai_han"]
     
     # Chi tiết Tài sản ngắn hạn
-    tien_va_cac_khoan_tuong_duong_tien = safe_extract_value_and_round(df, ["Tiền và các khoản tương đương tiền", "Tiền và tương đương tiền (đồng)"], first_numeric_column)
-    dau_tu_tai_chinh_ngan_han = safe_extract_value_and_round(df, ["Đầu tư tài chính ngắn hạn", "Giá trị thuần đầu tư ngắn hạn (đồng)"], first_numeric_column)
-    cac_khoan_phai_thu_ngan_han = safe_extract_value_and_round(df, ["Các khoản phải thu ngắn hạn", "Các khoản phải thu ngắn hạn (đồng)"], first_numeric_column)
-    hang_ton_kho = safe_extract_value_and_round(df, ["Hàng tồn kho", "Hàng tồn kho ròng", "Hàng tồn kho, ròng (đồng)"], first_numeric_column)
-    tai_san_ngan_han_khac = safe_extract_value_and_round(df, ["Tài sản ngắn hạn khác", "Tài sản lưu động khác"], first_numeric_column)
+    tien_va_cac_khoan_tuong_duong_tien = values["tien_va_cac_khoan_tuong_duong_tien"]
+    dau_tu_tai_chinh_ngan_han = values["dau_tu_tai_chinh_ngan_han"]
+    cac_khoan_phai_thu_ngan_han = values["cac_khoan_phai_thu_ngan_han"]
+    hang_ton_kho = values["hang_ton_kho"]
+    tai_san_ngan_han_khac = values["tai_san_ngan_han_khac"]
 
     # Chi tiết Tài sản dài hạn
-    tai_san_co_dinh = safe_extract_value_and_round(df, ["Tài sản cố định", "Tài sản cố định (đồng)"], first_numeric_column)
-    tai_san_dai_han_khac = safe_extract_value_and_round(df, ["Tài sản dài hạn khác", "Tài sản dài hạn khác (đồng)"], first_numeric_column)
-    cac_khoan_phai_thu_dai_han = safe_extract_value_and_round(df, ["Các khoản phải thu dài hạn", "Phải thu dài hạn (đồng)"], first_numeric_column)
-    bat_dong_san_dau_tu = safe_extract_value_and_round(df, ["Bất động sản đầu tư", "Giá trị ròng tài sản đầu tư"], first_numeric_column)
-    tai_san_do_dang_dai_han = safe_extract_value_and_round(df, ["Tài sản dở dang dài hạn", "Chi phí xây dựng cơ bản dở dang", "Chi phí xây dựng cơ bản dở dang (đồng)"], first_numeric_column)
-    dau_tu_tai_chinh_dai_han = safe_extract_value_and_round(df, ["Đầu tư tài chính dài hạn", "Đầu tư dài hạn (đồng)"], first_numeric_column)
-    loi_the_thuong_mai = safe_extract_value_and_round(df, ["Lợi thế thương mại", "Lợi thế thương mại (đồng)"], first_numeric_column)
+    tai_san_co_dinh = values["tai_san_co_dinh"]
+    tai_san_dai_han_khac = values["tai_san_dai_han_khac"]
+    cac_khoan_phai_thu_dai_han = values["cac_khoan_phai_thu_dai_han"]
+    bat_dong_san_dau_tu = values["bat_dong_san_dau_tu"]
+    tai_san_do_dang_dai_han = values["tai_san_do_dang_dai_han"]
+    dau_tu_tai_chinh_dai_han = values["dau_tu_tai_chinh_dai_han"]
+    loi_the_thuong_mai = values["loi_the_thuong_mai"]
 
     # Nguồn vốn
-    no_phai_tra = safe_extract_value_and_round(df, ["NỢ PHẢI TRẢ", "NỢ PHẢI TRẢ (đồng)"], first_numeric_column)
-    von_chu_so_huu = safe_extract_value_and_round(df, ["VỐN CHỦ SỞ HỮU", "VỐN CHỦ SỞ HỮU (đồng)"], first_numeric_column)
-    no_ngan_han = safe_extract_value_and_round(df, ["Nợ ngắn hạn", "Nợ ngắn hạn (đồng)"], first_numeric_column)
-    no_dai_han = safe_extract_value_and_round(df, ["Nợ dài hạn", "Nợ dài hạn (đồng)"], first_numeric_column)
+    no_phai_tra = values["no_phai_tra"]
+    von_chu_so_huu = values["von_chu_so_huu"]
+    no_ngan_han = values["no_ngan_han"]
+    no_dai_han = values["no_dai_han"]
 
     # Chi tiết Nợ ngắn hạn
-    phai_tra_nguoi_ban_ngan_han = safe_extract_value_and_round(df, ["Phải trả người bán ngắn hạn", "Phải trả người bán", "Phải trả cho người bán"], first_numeric_column)
-    nguoi_mua_tra_tien_truoc_ngan_han = safe_extract_value_and_round(df, ["Người mua trả tiền trước ngắn hạn", "Người mua trả tiền trước ngắn hạn (đồng)"], first_numeric_column)
-    thue_va_cac_khoan_phai_nop_nha_nuoc = safe_extract_value_and_round(df, ["Thuế và các khoản phải nộp Nhà nước"], first_numeric_column)
-    phai_tra_nguoi_lao_dong = safe_extract_value_and_round(df, ["Phải trả người lao động"], first_numeric_column)
-    chi_phi_phai_tra_ngan_han = safe_extract_value_and_round(df, ["Chi phí phải trả ngắn hạn"], first_numeric_column)
-    phai_tra_khac_ngan_han = safe_extract_value_and_round(df, ["Phải trả ngắn hạn khác"], first_numeric_column)
-    vay_va_no_thue_tai_chinh_ngan_han = safe_extract_value_and_round(df, ["Vay và nợ thuê tài chính ngắn hạn", "Vay và nợ thuê tài chính ngắn hạn (đồng)"], first_numeric_column)
-    quy_khen_thuong_phuc_loi = safe_extract_value_and_round(df, ["Quỹ khen thưởng, phúc lợi", "Quỹ khen thưởng phúc lợi", "Quỹ khen thưởng và phúc lợi"], first_numeric_column)
-    du_phong_phai_tra_ngan_han = safe_extract_value_and_round(df, ["Dự phòng phải trả ngắn hạn"], first_numeric_column)
+    phai_tra_nguoi_ban_ngan_han = values["phai_tra_nguoi_ban_ngan_han"]
+    nguoi_mua_tra_tien_truoc_ngan_han = values["nguoi_mua_tra_tien_truoc_ngan_han"]
+    thue_va_cac_khoan_phai_nop_nha_nuoc = values["thue_va_cac_khoan_phai_nop_nha_nuoc"]
+    phai_tra_nguoi_lao_dong = values["phai_tra_nguoi_lao_dong"]
+    chi_phi_phai_tra_ngan_han = values["chi_phi_phai_tra_ngan_han"]
+    phai_tra_khac_ngan_han = values["phai_tra_khac_ngan_han"]
+    vay_va_no_thue_tai_chinh_ngan_han = values["vay_va_no_thue_tai_chinh_ngan_han"]
+    quy_khen_thuong_phuc_loi = values["quy_khen_thuong_phuc_loi"]
+    du_phong_phai_tra_ngan_han = values["du_phong_phai_tra_ngan_han"]
 
     # Chi tiết Nợ dài hạn
-    vay_va_no_thue_tai_chinh_dai_han = safe_extract_value_and_round(df, ["Vay và nợ thuê tài chính dài hạn", "Vay và nợ thuê tài chính dài hạn (đồng)"], first_numeric_column)
-    phai_tra_nha_cung_cap_dai_han = safe_extract_value_and_round(df, ["Phải trả nhà cung cấp dài hạn", "Phải trả người bán dài hạn"], first_numeric_column)
-    nguoi_mua_tra_tien_truoc_dai_han = safe_extract_value_and_round(df, ["Người mua trả tiền trước dài hạn"], first_numeric_column)
-    chi_phi_phai_tra_dai_han = safe_extract_value_and_round(df, ["Chi phí phải trả dài hạn", "Chi phí phải trả dài hạn (đồng)"], first_numeric_column)
-    phai_tra_noi_bo_von_kinh_doanh = safe_extract_value_and_round(df, ["Phải trả nội bộ về vốn kinh doanh"], first_numeric_column)
-    phai_tra_noi_bo_dai_han = safe_extract_value_and_round(df, ["Phải trả nội bộ dài hạn"], first_numeric_column)
-    doanh_thu_chua_thuc_hien_dai_han = safe_extract_value_and_round(df, ["Doanh thu chưa thực hiện dài hạn"], first_numeric_column)
-    phai_tra_dai_han_khac = safe_extract_value_and_round(df, ["Phải trả dài hạn khác"], first_numeric_column)
-    trai_phieu_chuyen_doi = safe_extract_value_and_round(df, ["Trái phiếu chuyển đổi"], first_numeric_column)
-    co_phieu_uu_dai_no = safe_extract_value_and_round(df, ["Cổ phiếu ưu đãi (Nợ)"], first_numeric_column)
-    thue_thu_nhap_hoan_lai_phai_tra = safe_extract_value_and_round(df, ["Thuế thu nhập hoãn lại phải trả"], first_numeric_column)
-    du_phong_phai_tra_dai_han = safe_extract_value_and_round(df, ["Dự phòng phải trả dài hạn"], first_numeric_column)
-    quy_phat_trien_khoa_hoc_cong_nghe = safe_extract_value_and_round(df, ["Quỹ phát triển khoa học và công nghệ"], first_numeric_column)
-    du_phong_tro_cap_mat_viec = safe_extract_value_and_round(df, ["Dự phòng trợ cấp mất việc làm"], first_numeric_column)
+    vay_va_no_thue_tai_chinh_dai_han = values["vay_va_no_thue_tai_chinh_dai_han"]
+    phai_tra_nha_cung_cap_dai_han = values["phai_tra_nha_cung_cap_dai_han"]
+    nguoi_mua_tra_tien_truoc_dai_han = values["nguoi_mua_tra_tien_truoc_dai_han"]
+    chi_phi_phai_tra_dai_han = values["chi_phi_phai_tra_dai_han"]
+    phai_tra_noi_bo_von_kinh_doanh = values["phai_tra_noi_bo_von_kinh_doanh"]
+    phai_tra_noi_bo_dai_han = values["phai_tra_noi_bo_dai_han"]
+    doanh_thu_chua_thuc_hien_dai_han = values["doanh_thu_chua_thuc_hien_dai_han"]
+    phai_tra_dai_han_khac = values["phai_tra_dai_han_khac"]
+    trai_phieu_chuyen_doi = values["trai_phieu_chuyen_doi"]
+    co_phieu_uu_dai_no = values["co_phieu_uu_dai_no"]
+    thue_thu_nhap_hoan_lai_phai_tra = values["thue_thu_nhap_hoan_lai_phai_tra"]
+    du_phong_phai_tra_dai_han = values["du_phong_phai_tra_dai_han"]
+    quy_phat_trien_khoa_hoc_cong_nghe = values["quy_phat_trien_khoa_hoc_cong_nghe"]
+    du_phong_tro_cap_mat_viec = values["du_phong_tro_cap_mat_viec"]
 
     # Chi tiết Vốn chủ sở hữu
-    von_gop_chu_so_huu = safe_extract_value_and_round(df, ["Vốn góp của chủ sở hữu", "Vốn góp của chủ sở hữu (đồng)"], first_numeric_column)
-    thang_du_von_co_phan = safe_extract_value_and_round(df, ["Thặng dư vốn cổ phần"], first_numeric_column)
-    quyen_chon_chuyen_doi_trai_phieu = safe_extract_value_and_round(df, ["Quyền chọn chuyển đổi trái phiếu"], first_numeric_column)
-    von_khac_chu_so_huu = safe_extract_value_and_round(df, ["Vốn khác của chủ sở hữu"], first_numeric_column)
-    co_phieu_quy = safe_extract_value_and_round(df, ["Cổ phiếu quỹ"], first_numeric_column)
-    chenh_lech_danh_gia_lai_tai_san = safe_extract_value_and_round(df, ["Chênh lệch đánh giá lại tài sản"], first_numeric_column)
-    chenh_lech_ty_gia_hoi_doai = safe_extract_value_and_round(df, ["Chênh lệch tỷ giá hối đoái"], first_numeric_column)
-    quy_dau_tu_phat_trien = safe_extract_value_and_round(df, ["Quỹ đầu tư phát triển", "Quỹ đầu tư và phát triển (đồng)"], first_numeric_column)
-    quy_ho_tro_sap_xep_doanh_nghiep = safe_extract_value_and_round(df, ["Quỹ hỗ trợ sắp xếp doanh nghiệp"], first_numeric_column)
-    quy_khac_thuoc_von_chu_so_huu = safe_extract_value_and_round(df, ["Quỹ khác thuộc vốn chủ sở hữu"], first_numeric_column)
-    loi_nhuan_chua_phan_phoi = safe_extract_value_and_round(df, ["Lợi nhuận sau thuế chưa phân phối", "Lãi chưa phân phối (đồng)"], first_numeric_column)
-    loi_ich_co_dong_khong_kiem_soat = safe_extract_value_and_round(df, ["Lợi ích cổ đông không kiểm soát", "Lợi ích của cổ đông thiểu số", "LỢI ÍCH CỦA CỔ ĐÔNG THIỂU SỐ"], first_numeric_column)
-    nguon_kinh_phi_va_quy_khac = safe_extract_value_and_round(df, ["Nguồn kinh phí và quỹ khác"], first_numeric_column)
+    von_gop_chu_so_huu = values["von_gop_chu_so_huu"]
+    thang_du_von_co_phan = values["thang_du_von_co_phan"]
+    quyen_chon_chuyen_doi_trai_phieu = values["quyen_chon_chuyen_doi_trai_phieu"]
+    von_khac_chu_so_huu = values["von_khac_chu_so_huu"]
+    co_phieu_quy = values["co_phieu_quy"]
+    chenh_lech_danh_gia_lai_tai_san = values["chenh_lech_danh_gia_lai_tai_san"]
+    chenh_lech_ty_gia_hoi_doai = values["chenh_lech_ty_gia_hoi_doai"]
+    quy_dau_tu_phat_trien = values["quy_dau_tu_phat_trien"]
+    quy_ho_tro_sap_xep_doanh_nghiep = values["quy_ho_tro_sap_xep_doanh_nghiep"]
+    quy_khac_thuoc_von_chu_so_huu = values["quy_khac_thuoc_von_chu_so_huu"]
+    loi_nhuan_chua_phan_phoi = values["loi_nhuan_chua_phan_phoi"]
+    loi_ich_co_dong_khong_kiem_soat = values["loi_ich_co_dong_khong_kiem_soat"]
+    nguon_kinh_phi_va_quy_khac = values["nguon_kinh_phi_va_quy_khac"]
 
     # BUILD FLOWS
     # Recalculate hierarchy totals to ensure visual balance
@@ -186,7 +254,7 @@ def _extract_flows_logic(df, first_numeric_column):
     plug_equity = max(0, target_equity - total_calc_equity)
     
     # Re-adjust group 3 if there's a plug to avoid gaps in Sankey
-    if plug_equity > (target_equity * 0.005):
+    if plug_equity > (target_equity * PLUG_TOLERANCE):
         # We'll add it as a separate flow inside Lợi nhuận group later
         pass
     else:
@@ -269,14 +337,14 @@ def _extract_flows_logic(df, first_numeric_column):
     if plug_equity > 0:
         flows.append(("Lợi nhuận", plug_equity, "Thông tin khác"))
 
-    # Threshold for displaying flows - 1% to filter out minor items
-    THRESHOLD_PERCENT = 0.01
-    threshold_value = tong_tai_san * THRESHOLD_PERCENT if tong_tai_san > 0 else 1
+    # Threshold for displaying flows - 1% by default to filter out minor items
+    threshold_percent = THRESHOLD_PERCENT if threshold is None else threshold
+    threshold_value = tong_tai_san * threshold_percent if tong_tai_san > 0 else 1
     
+    # Luồng nhỏ hơn ngưỡng được gộp vào nút "Khác (<nút>)" để tổng các nút cha không đổi
     output_lines = []
-    for source, value, target in flows:
-        if value >= threshold_value:
-            output_lines.append(f"{source} [{value}] {target}")
+    for source, value, target in fold_small_flows(flows, threshold_value):
+        output_lines.append(f"{source} [{value}] {target}")
     
     return "\n".join(output_lines)
 
@@ -286,6 +354,8 @@ def extract_flows_from_excel(file_input):
     file_input: Đường dẫn file (str) hoặc file object (bytes).
     """
     try:
+        import pandas as pd
+
         # Đọc file Excel
         # skiprows=4 như code cũ
         df = pd.read_excel(file_input, skiprows=4)
@@ -0,0 +1,265 @@
+"""
+Batch export CLI: SankeyMATIC text + JSON graphs for symbols x reports x periods
+Runs data_fetcher and the extractors directly (no HTTP) on a worker pool,
+within the upstream vnstock rate budget.
+
+Example:
+    python batch_export.py --preset VN30 --periods year Q4 --years 2024 --out exports
+    python batch_export.py --symbols-file symbols.txt --reports income cashflow --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from data_fetcher import fetch_raw_statement, fetch_financial_data
+from derived_periods import TTM, statement_period_type
+from cache import cached_extract
+from flow_utils import DEFAULT_UNIT, prune_flows, parse_flow_options, flows_to_graph
+from stats import percentile
+import balance
+import cashflow
+import income
+
+EXTRACTORS = {
+    'balance': balance,
+    'income': income,
+    'cashflow': cashflow,
+}
+
+# VN30 basket (HOSE), update when the index is rebalanced
+PRESETS = {
+    'VN30': [
+        'ACB', 'BCM', 'BID', 'BVH', 'CTG', 'FPT', 'GAS', 'GVR', 'HDB', 'HPG',
+        'LPB', 'MBB', 'MSN', 'MWG', 'PLX', 'SAB', 'SHB', 'SSB', 'SSI', 'STB',
+        'TCB', 'TPB', 'VCB', 'VHM', 'VIB', 'VIC', 'VJC', 'VNM', 'VPB', 'VRE',
+    ],
+}
+
+PROGRESS_FILE = 'progress.jsonl'
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all workers: at most `per_minute` upstream calls per minute
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def load_symbols(args):
+    symbols = []
+    if args.preset:
+        symbols += PRESETS[args.preset.upper()]
+    if args.symbols:
+        symbols += [s for part in args.symbols for s in part.split(',')]
+    if args.symbols_file:
+        with open(args.symbols_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0]
+                symbols += [s for s in line.replace(',', ' ').split()]
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+
+
+def options_tag(extract_params, max_flows, unit):
+    """Short suffix for non-default flow options ('' for the defaults), e.g. 't0.05-million-max5'"""
+    parts = []
+    if 'threshold' in extract_params:
+        parts.append(f"t{extract_params['threshold']:g}")
+    if unit != DEFAULT_UNIT:
+        parts.append(unit)
+    if max_flows:
+        parts.append(f"max{max_flows}")
+    return '-'.join(parts)
+
+
+def task_key(symbol, report_type, period, year, tag=''):
+    """Progress key, also the output path (without extension) relative to --out"""
+    key = f"{symbol}/{report_type}_{period}_{year}"
+    return f"{key}__{tag}" if tag else key
+
+
+def load_progress(out_dir):
+    """Return the set of task keys already exported successfully"""
+    done = set()
+    path = os.path.join(out_dir, PROGRESS_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # partially written line from an interrupted run
+                if entry.get('status') == 'ok':
+                    done.add(entry['key'])
+    return done
+
+
+def export_one(symbol, report_type, period, year, out_dir, extract_params, max_flows, unit):
+    """Fetch (from STATEMENT_CACHE when possible), extract and write one report. Returns actual_period."""
+    df, actual_period = fetch_financial_data(symbol, report_type, period, year)
+    text = prune_flows(cached_extract(EXTRACTORS[report_type], df, **extract_params), max_flows)
+    if not text or text.startswith('// Error'):
+        raise ValueError(text or 'Empty extraction result')
+
+    os.makedirs(os.path.join(out_dir, symbol), exist_ok=True)
+    tag = options_tag(extract_params, max_flows, unit)
+    base = os.path.join(out_dir, task_key(symbol, report_type, period, year, tag))
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(text)
+    graph = {
+        'symbol': symbol,
+        'report_type': report_type,
+        'period': period,
+        'year': year,
+        'actual_period': actual_period,
+        'unit': unit,
+        **flows_to_graph(text),
+    }
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(graph, f, ensure_ascii=False)
+    return actual_period
+
+
+def run_job(symbol, report_type, period_type, tasks, limiter, options):
+    """
+    One upstream call per (symbol, report_type, period_type), then every requested
+    period/year is selected from the cached statement.
+    Returns a list of (key, status, detail, latency_seconds).
+    """
+    results = []
+    tag = options_tag(options['extract_params'], options['max_flows'], options['unit'])
+    started = time.perf_counter()
+    try:
+        limiter.acquire()
+        fetch_raw_statement(symbol, report_type, period_type)
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        return [(task_key(symbol, report_type, p, y, tag), 'error', str(e), elapsed) for p, y in tasks]
+
+    # A missing Q4 (also needed by TTM) is derived from the annual statement: fetch it here,
+    # under the limiter, instead of letting fetch_financial_data make an uncounted call
+    if period_type == 'quarter' and any(p.upper() in ('Q4', TTM) for p, _ in tasks):
+        limiter.acquire()
+        try:
+            fetch_raw_statement(symbol, report_type, 'year')
+        except Exception as e:
+            print(f"⚠️ Annual {report_type} for {symbol} unavailable, cannot derive Q4: {e}")
+    fetch_elapsed = time.perf_counter() - started
+
+    for period, year in tasks:
+        t0 = time.perf_counter()
+        key = task_key(symbol, report_type, period, year, tag)
+        try:
+            actual_period = export_one(symbol, report_type, period, year, options['out'],
+                                       options['extract_params'], options['max_flows'], options['unit'])
+            status, detail = 'ok', actual_period
+        except Exception as e:
+            status, detail = 'error', str(e)
+        # The upstream fetch (including rate-limit wait) is attributed to the job's first task
+        latency = time.perf_counter() - t0 + (fetch_elapsed if not results else 0)
+        results.append((key, status, detail, latency))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export Sankey flows for many symbols without the HTTP API')
+    parser.add_argument('--symbols', nargs='*', help='Symbols, space or comma separated')
+    parser.add_argument('--symbols-file', help='File with one or more symbols per line (# comments allowed)')
+    parser.add_argument('--preset', choices=sorted(PRESETS), help='Named symbol list')
+    parser.add_argument('--reports', nargs='+', default=list(EXTRACTORS), choices=list(EXTRACTORS))
+    parser.add_argument('--periods', nargs='+', default=['year'], help="'year', Q1..Q4 and/or TTM")
+    parser.add_argument('--years', nargs='+', type=int, default=[time.localtime().tm_year - 1])
+    parser.add_argument('--out', default='exports', help='Output directory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=60, help='Max upstream calls per minute (vnstock: 60 with API key, 20 as guest)')
+    parser.add_argument('--threshold', type=float)
+    parser.add_argument('--unit')
+    parser.add_argument('--max-flows-per-node', type=int)
+    parser.add_argument('--restart', action='store_true', help='Ignore previous progress and export everything again')
+    args = parser.parse_args(argv)
+
+    symbols = load_symbols(args)
+    if not symbols:
+        parser.error('No symbols given (use --symbols, --symbols-file or --preset)')
+
+    try:
+        extract_params, max_flows, unit = parse_flow_options({
+            'threshold': args.threshold,
+            'unit': args.unit,
+            'max_flows_per_node': args.max_flows_per_node,
+        })
+    except (ValueError, TypeError) as e:
+        parser.error(str(e))
+
+    os.makedirs(args.out, exist_ok=True)
+    progress_path = os.path.join(args.out, PROGRESS_FILE)
+    if args.restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    done = load_progress(args.out)
+    tag = options_tag(extract_params, max_flows, unit)
+
+    # Group pending tasks into jobs sharing one upstream statement
+    jobs = {}
+    skipped = 0
+    for symbol in symbols:
+        for report_type in args.reports:
+            for period in args.periods:
+                period_type = statement_period_type(period)
+                for year in args.years:
+                    if task_key(symbol, report_type, period, year, tag) in done:
+                        skipped += 1
+                        continue
+                    jobs.setdefault((symbol, report_type, period_type), []).append((period, year))
+
+    total = sum(len(t) for t in jobs.values())
+    print(f"📦 {total} exports in {len(jobs)} upstream jobs ({skipped} already done), "
+          f"{args.workers} workers, {args.rate:g} calls/min")
+
+    options = {'out': args.out, 'extract_params': extract_params, 'max_flows': max_flows, 'unit': unit}
+    limiter = RateLimiter(args.rate)
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+
+    with open(progress_path, 'a', encoding='utf-8') as progress, \
+            ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_job, *job, tasks, limiter, options) for job, tasks in jobs.items()]
+        for future in as_completed(futures):
+            for key, status, detail, latency in future.result():
+                latencies.append(latency)
+                if status != 'ok':
+                    failures += 1
+                    print(f"❌ {key}: {detail}")
+                progress.write(json.dumps({'key': key, 'status': status, 'detail': detail,
+                                           'latency': round(latency, 4)}, ensure_ascii=False) + '\n')
+                progress.flush()
+
+    elapsed = time.perf_counter() - started
+    print("\n=== Summary ===")
+    print(f"exported: {total - failures}  failed: {failures}  skipped: {skipped}")
+    print(f"wall time: {elapsed:.1f}s  throughput: {total / elapsed if elapsed else 0:.2f} exports/s")
+    print(f"latency p50: {percentile(latencies, 50) * 1000:.0f} ms  "
+          f"p95: {percentile(latencies, 95) * 1000:.0f} ms  "
+          f"max: {max(latencies, default=0) * 1000:.0f} ms")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
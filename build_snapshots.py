@@ -0,0 +1,227 @@
+"""
+Build precomputed snapshot bundles for the most viewed tickers
+
+Each bundle holds what /api/generate-all-reports returns for one symbol/period/year with the
+default options (all three reports' flows plus actual_periods), gzip-compressed under
+static/snapshots/, so the browser can load it through Flask's static path without touching
+the fetch/extract code. static/snapshots/manifest.json lists the bundles with the statement
+fingerprints they were built from; a bundle is only rewritten when a fingerprint (i.e. the
+published statement) or an extractor version changed, so running this on a schedule picks up
+new statements. Each bundle also records when it was last built or confirmed unchanged
+(verified_at); bundles that have not been verified within --max-age-hours are not served.
+
+Example:
+    python build_snapshots.py --preset VN30
+    python build_snapshots.py --symbols VNM FPT --periods year Q4 TTM --years 2025 2026
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from batch_export import EXTRACTORS, PRESETS, RateLimiter, load_symbols
+from cache import cached_extract, statement_fingerprint
+from data_fetcher import fetch_raw_statement, fetch_financial_data
+from derived_periods import TTM, statement_period_type
+from flow_utils import prune_flows, parse_flow_options
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'snapshots')
+MANIFEST_FILE = 'manifest.json'
+
+
+def bundle_key(symbol, period, year):
+    """Manifest key, also the bundle path without extension (matches app.js)"""
+    return f"{symbol}/{period}_{year}"
+
+
+def extractor_versions():
+    return {name: getattr(module, 'EXTRACTOR_VERSION', 0) for name, module in EXTRACTORS.items()}
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == SNAPSHOT_VERSION and manifest.get('extractor_versions') == extractor_versions():
+            return manifest
+        print("♻️ Snapshot format or extractor versions changed, rebuilding every bundle")
+    return {'bundles': {}}
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def drop_expired(manifest, out_dir, max_age_hours):
+    """
+    Remove bundles whose last successful build or check (verified_at) is older than
+    max_age_hours, so bundles that keep failing to rebuild stop being served. Returns the keys.
+    """
+    cutoff = datetime.now(timezone.utc).timestamp() - max_age_hours * 3600
+    expired = []
+    for key, entry in list(manifest['bundles'].items()):
+        verified_at = entry.get('verified_at')
+        if verified_at and datetime.fromisoformat(verified_at).timestamp() >= cutoff:
+            continue
+        del manifest['bundles'][key]
+        path = os.path.join(out_dir, entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+        expired.append(key)
+    return expired
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_bundle(symbol, period, year, options):
+    """
+    Fetch (through STATEMENT_CACHE) and extract the three reports.
+
+    Returns:
+        tuple: (payload like /api/generate-all-reports, {report_type: fingerprint})
+    """
+    extract_params, max_flows, unit = options
+    data, actual_periods, fingerprints = {}, {}, {}
+    for report_type, module in EXTRACTORS.items():
+        statement, actual_period = fetch_financial_data(symbol, report_type, period, year)
+        flows = prune_flows(cached_extract(module, statement, **extract_params), max_flows)
+        if not flows or flows.startswith('// Error'):
+            raise ValueError(f"{report_type}: {flows or 'no flows'}")
+        data[report_type] = flows
+        actual_periods[report_type] = actual_period
+        fingerprints[report_type] = statement_fingerprint(statement)
+
+    payload = {
+        'success': True,
+        'data': data,
+        'symbol': symbol,
+        'period': period,
+        'year': year,
+        'unit': unit,
+        'actual_periods': actual_periods,
+    }
+    return payload, fingerprints
+
+
+def run_symbol(symbol, targets, limiter, options, manifest, out_dir):
+    """Build every (period, year) bundle of one symbol. Returns a list of (key, status, detail)."""
+    results = []
+    # One upstream call per statement; every target is then built from STATEMENT_CACHE.
+    # Q4 and TTM may need the annual statement to derive a Q4, so it is fetched here under the limiter
+    period_types = {statement_period_type(period) for period, _ in targets}
+    if any(period.upper() in ('Q4', TTM) for period, _ in targets):
+        period_types.add('year')
+    period_types = sorted(period_types)
+    try:
+        for report_type in EXTRACTORS:
+            for period_type in period_types:
+                limiter.acquire()
+                fetch_raw_statement(symbol, report_type, period_type)
+    except Exception as e:
+        return [(bundle_key(symbol, p, y), 'error', str(e)) for p, y in targets]
+
+    for period, year in targets:
+        key = bundle_key(symbol, period, year)
+        try:
+            payload, fingerprints = build_bundle(symbol, period, year, options)
+        except Exception as e:
+            # Keep the previous bundle (if any) rather than publishing a partial one
+            results.append((key, 'error', str(e)))
+            continue
+
+        previous = manifest['bundles'].get(key)
+        path = os.path.join(out_dir, f"{key}.json.gz")
+        now = utc_now()
+        if (previous and previous['fingerprints'] == fingerprints
+                and previous['actual_periods'] == payload['actual_periods'] and os.path.exists(path)):
+            # Still matches upstream: only the check time moves forward
+            previous['verified_at'] = now
+            results.append((key, 'unchanged', payload['actual_periods']))
+            continue
+
+        payload['built_at'] = now
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        write_atomic(path, gzip.compress(body, mtime=0))
+        manifest['bundles'][key] = {
+            'file': f"{key}.json.gz",
+            'built_at': now,
+            'verified_at': now,
+            'actual_periods': payload['actual_periods'],
+            'fingerprints': fingerprints,
+        }
+        results.append((key, 'written', payload['actual_periods']))
+    return results
+
+
+def main(argv=None):
+    this_year = datetime.now().year
+    parser = argparse.ArgumentParser(description='Build precomputed all-reports snapshot bundles')
+    parser.add_argument('--symbols', nargs='+', help='Symbols (space or comma separated)')
+    parser.add_argument('--symbols-file', help='Text file with one or more symbols per line')
+    parser.add_argument('--preset', choices=sorted(PRESETS), help='Predefined basket')
+    parser.add_argument('--periods', nargs='+', default=['year'], help="'year', Q1..Q4 and/or TTM")
+    parser.add_argument('--years', nargs='+', type=int, default=[this_year, this_year - 1],
+                        help='Requested years (the UI defaults to the current year)')
+    parser.add_argument('--out', default=SNAPSHOT_DIR, help='Output directory (served as /static/snapshots)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=60, help='Max upstream calls per minute')
+    parser.add_argument('--max-age-hours', type=float, default=24,
+                        help='Bundles not rebuilt or re-verified for this long are ignored by clients '
+                             'and removed by the next build')
+    args = parser.parse_args(argv)
+
+    symbols = load_symbols(args)
+    if not symbols:
+        parser.error('No symbols given (use --symbols, --symbols-file or --preset)')
+
+    targets = [(period, year) for period in args.periods for year in args.years]
+    options = parse_flow_options({})  # same defaults as the API / UI
+    manifest = load_manifest(args.out)
+    limiter = RateLimiter(args.rate)
+
+    print(f"📦 Building {len(symbols) * len(targets)} bundles for {len(symbols)} symbols into {args.out}")
+    started = time.perf_counter()
+    counts = {'written': 0, 'unchanged': 0, 'error': 0}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_symbol, symbol, targets, limiter, options, manifest, args.out)
+                   for symbol in symbols]
+        for future in as_completed(futures):
+            for key, status, detail in future.result():
+                counts[status] += 1
+                icon = {'written': '✅', 'unchanged': '⏭️', 'error': '❌'}[status]
+                print(f"{icon} {key}: {detail}")
+
+    for key in drop_expired(manifest, args.out, args.max_age_hours):
+        print(f"🗑️ {key}: not verified within {args.max_age_hours:g} h, removed")
+
+    manifest.update({
+        'version': SNAPSHOT_VERSION,
+        'generated_at': utc_now(),
+        'max_age_hours': args.max_age_hours,
+        'extractor_versions': extractor_versions(),
+    })
+    manifest['bundles'] = dict(sorted(manifest['bundles'].items()))
+    write_atomic(os.path.join(args.out, MANIFEST_FILE),
+                 json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    elapsed = time.perf_counter() - started
+    print(f"\nDone in {elapsed:.1f}s: {counts['written']} written, {counts['unchanged']} unchanged, "
+          f"{counts['error']} failed")
+    return 1 if counts['error'] and not (counts['written'] or counts['unchanged']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+In-process caches for the Sankey pipeline
+Memoizes flow extraction by statement content so identical statements are only processed once,
+and provides the LRU container used by data_fetcher for raw statements
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from statement import as_statement
+
+
+class LRUCache:
+    """
+    Thread-safe mapping with a fixed number of entries and least-recently-used eviction.
+    Entries older than ttl seconds (if given) are treated as missing.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                stored_at, value = self._data[key]
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def values(self):
+        """Snapshot of the stored values (expired entries included), most recent last"""
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def stats(self):
+        """Return counters for health/debug output"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Extraction results are small strings, so a few hundred statements cost well under a few MB
+FLOW_CACHE = LRUCache(maxsize=int(os.environ.get('FLOW_CACHE_SIZE', 512)))
+
+
+def statement_fingerprint(statement):
+    """
+    Hash the (item, value) content of a Statement (see statement.py).
+
+    Only the labels and the first period are used and the period name is ignored, so the
+    same figures selected through different year/period fallbacks produce the same key.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(statement.labels).encode('utf-8'))
+    h.update(b"\x1e")
+    if statement.columns:
+        h.update(statement.columns[0].tobytes())
+    return h.hexdigest()
+
+
+def cached_extract(module, df, **params):
+    """
+    Run module.extract_flows_from_dataframe(df, **params) through FLOW_CACHE.
+    df may be a Statement or a DataFrame (converted once here).
+
+    The key combines the statement fingerprint, the extractor module and its
+    EXTRACTOR_VERSION, and any threshold parameters. Error outputs are not cached.
+    """
+    statement = as_statement(df)
+    key = (
+        module.__name__,
+        getattr(module, 'EXTRACTOR_VERSION', 0),
+        tuple(sorted(params.items())),
+        statement_fingerprint(statement),
+    )
+    result = FLOW_CACHE.get(key)
+    if result is not None:
+        return result
+
+    result = module.extract_flows_from_dataframe(statement, **params)
+    if result and not result.startswith('// Error'):
+        FLOW_CACHE.set(key, result)
+    return result
@@ -1,83 +1,91 @@
-import pandas as pd
-import re
+import math
+
+from flow_utils import fold_small_flows
+from label_matcher import LabelMatcher
+from statement import as_statement
+
+# Tăng số này mỗi khi thay đổi logic trích xuất để làm mới cache kết quả (xem cache.py)
+EXTRACTOR_VERSION = 4
+
+# Ngưỡng hiển thị mặc định: 1% tổng dòng tiền vào
+THRESHOLD_PERCENT = 0.01
+
+# Các chỉ tiêu cần trích xuất và tên đồng nghĩa
+CASHFLOW_ITEMS = {
+    "net_kd": "Lưu chuyển tiền thuần từ hoạt động kinh doanh",
+    "net_dt": "Lưu chuyển tiền thuần từ hoạt động đầu tư",
+    "net_tc": "Lưu chuyển tiền thuần từ hoạt động tài chính",
+
+    "dau_ky": "Tiền và tương đương tiền đầu kỳ",
+    "cuoi_ky": "Tiền và tương đương tiền cuối kỳ",
+    "ty_gia": "Ảnh hưởng của thay đổi tỷ giá",
+
+    # Chi tiết Kinh doanh
+    "ln_truoc_thue": "Lợi nhuận trước thuế",
+    "ln_truoc_vld": "Lợi nhuận từ hoạt động kinh doanh trước thay đổi vốn lưu động",
+
+    # Chi tiết Đầu tư
+    "thu_thanh_ly": ["Tiền thu từ thanh lý", "nhượng bán TSCĐ"],
+    "thu_hoi_cho_vay": ["Tiền thu hồi cho vay", "bán lại các công cụ nợ"],
+    "thu_lai_vay_ct": ["Tiền thu lãi cho vay", "cổ tức và lợi nhuận được chia"],
+    "chi_mua_tscd": ["Tiền chi để mua sắm", "xây dựng TSCĐ"],
+    "chi_cho_vay": ["Tiền chi cho vay", "mua các công cụ nợ"],
+
+    # Chi tiết Tài chính
+    "thu_vay": "Tiền thu từ đi vay",
+    "chi_tra_goc_vay": "Tiền trả nợ gốc vay",
+    "chi_tra_co_tuc": ["Cổ tức, lợi nhuận đã trả", "Cổ tức đã trả"],
+}
+
+# Biên dịch toàn bộ tên đồng nghĩa một lần (xem label_matcher.py)
+_MATCHER = LabelMatcher(CASHFLOW_ITEMS)
 
 # --- Helper Functions ---
-def normalize_text(text):
-    if not isinstance(text, str): return ""
-    # Loại bỏ ký tự đánh dấu đầu dòng (I.1, a, -...) và nội dung trong ngoặc đơn
-    text = re.sub(r'^[A-Z0-9\.\s\-IXV]+[\.\s\-]+', '', text)
-    text = re.sub(r'\s*\(.*\)', '', text)
-    text = " ".join(text.split()).lower()
-    return text
+# Chuỗi kiểu kế toán "(1,234)" đã được chuyển thành số khi tạo Statement; ô trống là NaN
+def _value_or_zero(value):
+    return 0 if math.isnan(value) else value
+
+def extract_values(statement, column):
+    """Trích xuất toàn bộ chỉ tiêu trong CASHFLOW_ITEMS (VND) bằng một lần quét nhãn"""
+    rows = _MATCHER.match(statement.labels)
+    data = statement.column(column)
+    values = {}
+    for name, row in rows.items():
+        try: values[name] = 0 if row is None else _value_or_zero(data[row])
+        except: values[name] = 0
+    return values
 
 def safe_extract_value_and_round(df, chi_tieu_dao, column, unit_factor=1_000_000_000):
     try:
-        targets = [chi_tieu_dao] if isinstance(chi_tieu_dao, str) else chi_tieu_dao
-        targets_norm = [normalize_text(t) for t in targets]
-        
-        df_temp = df.copy()
-        target_col = df.columns[0]
-        df_temp["NORM"] = df_temp[target_col].apply(normalize_text)
-        
-        row = df_temp.loc[df_temp["NORM"].isin(targets_norm)]
-        if row.empty:
-            for t_norm in targets_norm:
-                mask = df_temp["NORM"].str.contains(t_norm, na=False, regex=False)
-                row = df_temp[mask]
-                if not row.empty: break
-        
-        if row.empty: return 0
-            
-        value = row[column].iloc[0]
-        if isinstance(value, str):
-            value = value.replace(',', '').replace('(', '-').replace(')', '').strip()
-            if value in ['-', '']: return 0
-            try: value = float(value)
-            except: return 0
-                
-        return float(value) if pd.notna(value) else 0
+        statement = as_statement(df)
+        row = LabelMatcher({"item": chi_tieu_dao}).match(statement.labels)["item"]
+        if row is None: return 0
+        return _value_or_zero(statement.column(str(column))[row])
     except:
         return 0
 
-def extract_flows_from_dataframe(df):
+def extract_flows_from_dataframe(df, threshold=None, unit_factor=1_000_000_000):
     """
     Tạo Sankey với Breakdown chi tiết theo format: Source [value] Target
     - Giá trị: số thập phân tỷ VND (VD: 222.438)
     - Mục chi tiết -> Activity node -> Pool -> Tiền cuối kỳ
+    - threshold: tỷ lệ so với tổng dòng tiền vào (mặc định THRESHOLD_PERCENT)
+    - unit_factor: đơn vị hiển thị (1e9 = tỷ VND)
     """
     try:
-        if df.shape[1] < 2: return "// Error: DataFrame thiếu dữ liệu cột giá trị."
-        col_val = df.columns[1] 
+        statement = as_statement(df)
+        if not statement.periods: return "// Error: DataFrame thiếu dữ liệu cột giá trị."
+        col_val = statement.periods[0]
         
-        # Format: Integer tỷ VND
-        def to_b(val): return round(val / 1_000_000_000)
+        # Format: Integer theo đơn vị hiển thị (mặc định tỷ VND)
+        def to_b(val): return round(val / unit_factor)
 
         # Trích xuất dữ liệu
-        net_kd = safe_extract_value_and_round(df, "Lưu chuyển tiền thuần từ hoạt động kinh doanh", col_val)
-        net_dt = safe_extract_value_and_round(df, "Lưu chuyển tiền thuần từ hoạt động đầu tư", col_val)
-        net_tc = safe_extract_value_and_round(df, "Lưu chuyển tiền thuần từ hoạt động tài chính", col_val)
-        
-        items = {
-            "dau_ky": safe_extract_value_and_round(df, "Tiền và tương đương tiền đầu kỳ", col_val),
-            "cuoi_ky": safe_extract_value_and_round(df, "Tiền và tương đương tiền cuối kỳ", col_val),
-            "ty_gia": safe_extract_value_and_round(df, "Ảnh hưởng của thay đổi tỷ giá", col_val),
-            
-            # Chi tiết Kinh doanh
-            "ln_truoc_thue": safe_extract_value_and_round(df, "Lợi nhuận trước thuế", col_val),
-            "ln_truoc_vld": safe_extract_value_and_round(df, "Lợi nhuận từ hoạt động kinh doanh trước thay đổi vốn lưu động", col_val),
-            
-            # Chi tiết Đầu tư
-            "thu_thanh_ly": safe_extract_value_and_round(df, ["Tiền thu từ thanh lý", "nhượng bán TSCĐ"], col_val),
-            "thu_hoi_cho_vay": safe_extract_value_and_round(df, ["Tiền thu hồi cho vay", "bán lại các công cụ nợ"], col_val),
-            "thu_lai_vay_ct": safe_extract_value_and_round(df, ["Tiền thu lãi cho vay", "cổ tức và lợi nhuận được chia"], col_val),
-            "chi_mua_tscd": safe_extract_value_and_round(df, ["Tiền chi để mua sắm", "xây dựng TSCĐ"], col_val),
-            "chi_cho_vay": safe_extract_value_and_round(df, ["Tiền chi cho vay", "mua các công cụ nợ"], col_val),
-            
-            # Chi tiết Tài chính
-            "thu_vay": safe_extract_value_and_round(df, "Tiền thu từ đi vay", col_val),
-            "chi_tra_goc_vay": safe_extract_value_and_round(df, "Tiền trả nợ gốc vay", col_val),
-            "chi_tra_co_tuc": safe_extract_value_and_round(df, ["Cổ tức, lợi nhuận đã trả", "Cổ tức đã trả"], col_val),
-        }
+        values = extract_values(statement, col_val)
+        net_kd = values["net_kd"]
+        net_dt = values["net_dt"]
+        net_tc = values["net_tc"]
+        items = {name: value for name, value in values.items() if not name.startswith("net_")}
 
         # Calculate Adjustment based on user formula: PBT - Net Operating Cash Flow
         # Adjustment = Items['ln_truoc_thue'] - net_kd
@@ -85,9 +93,9 @@ def extract_flows_from_dataframe(df):
         # Values for splitting PBT
         ln_thue = items["ln_truoc_thue"]
 
-        # Ngưỡng 1%
+        # Ngưỡng mặc định 1%
         total_inflow = max(0, items["dau_ky"]) + max(0, net_kd) + max(0, net_dt) + max(0, net_tc)
-        threshold = total_inflow * 0.01
+        threshold = total_inflow * (THRESHOLD_PERCENT if threshold is None else threshold)
 
         flows = []
         POOL = "Dòng tiền"
@@ -97,8 +105,8 @@ def extract_flows_from_dataframe(df):
         ADJ_NODE = "Điều chỉnh (không phải dòng tiền)"
 
         # === TIỀN ĐẦU KỲ ===
-        if items["dau_ky"] > threshold:
-            flows.append(f"Tiền đầu kỳ [{to_b(items['dau_ky'])}] {POOL}")
+        if items["dau_ky"] > 0:
+            flows.append(("Tiền đầu kỳ", items['dau_ky'], POOL))
 
         # === HOẠT ĐỘNG KINH DOANH ===
         # Use user formula: Adjustment = PBT - Net_KD
@@ -109,75 +117,78 @@ def extract_flows_from_dataframe(df):
         if adj > threshold:
             # Profit is higher than cash flow: leakage to adjustments
             if net_kd > threshold:
-                flows.append(f"Lợi nhuận trước thuế [{to_b(net_kd)}] {ACT_KD}")
-            flows.append(f"Lợi nhuận trước thuế [{to_b(adj)}] {ADJ_NODE}")
+                flows.append(("Lợi nhuận trước thuế", net_kd, ACT_KD))
+            flows.append(("Lợi nhuận trước thuế", adj, ADJ_NODE))
         elif adj < -threshold:
             # Cash flow is higher than profit: adjustments add to cash
             if ln_thue > threshold:
-                flows.append(f"Lợi nhuận trước thuế [{to_b(ln_thue)}] {ACT_KD}")
-            flows.append(f"{ADJ_NODE} [{to_b(abs(adj))}] {ACT_KD}")
+                flows.append(("Lợi nhuận trước thuế", ln_thue, ACT_KD))
+            flows.append((ADJ_NODE, abs(adj), ACT_KD))
         else:
             # No significant adjustment
             if ln_thue > threshold:
-                flows.append(f"Lợi nhuận trước thuế [{to_b(ln_thue)}] {ACT_KD}")
+                flows.append(("Lợi nhuận trước thuế", ln_thue, ACT_KD))
         
         # ACT_KD net -> POOL (hoặc ngược lại)
         if net_kd > threshold:
-            flows.append(f"{ACT_KD} [{to_b(net_kd)}] {POOL}")
+            flows.append((ACT_KD, net_kd, POOL))
         elif net_kd < -threshold:
-            flows.append(f"{POOL} [{to_b(abs(net_kd))}] {ACT_KD}")
+            flows.append((POOL, abs(net_kd), ACT_KD))
 
         # === HOẠT ĐỘNG ĐẦU TƯ ===
         # Chi tiết inflow -> ACT_DT
-        if items["thu_hoi_cho_vay"] > threshold:
-            flows.append(f"Tiền thu hồi cho vay [{to_b(items['thu_hoi_cho_vay'])}] {ACT_DT}")
-        if items["thu_lai_vay_ct"] > threshold:
-            flows.append(f"Tiền thu lãi cho vay, cổ tức [{to_b(items['thu_lai_vay_ct'])}] {ACT_DT}")
-        if items["thu_thanh_ly"] > threshold:
-            flows.append(f"Thu thanh lý TSCĐ [{to_b(items['thu_thanh_ly'])}] {ACT_DT}")
+        if items["thu_hoi_cho_vay"] > 0:
+            flows.append(("Tiền thu hồi cho vay", items['thu_hoi_cho_vay'], ACT_DT))
+        if items["thu_lai_vay_ct"] > 0:
+            flows.append(("Tiền thu lãi cho vay, cổ tức", items['thu_lai_vay_ct'], ACT_DT))
+        if items["thu_thanh_ly"] > 0:
+            flows.append(("Thu thanh lý TSCĐ", items['thu_thanh_ly'], ACT_DT))
         
         # ACT_DT net -> POOL (hoặc ngược lại)
         if net_dt > threshold:
-            flows.append(f"{ACT_DT} [{to_b(net_dt)}] {POOL}")
+            flows.append((ACT_DT, net_dt, POOL))
         elif net_dt < -threshold:
-            flows.append(f"{POOL} [{to_b(abs(net_dt))}] {ACT_DT}")
+            flows.append((POOL, abs(net_dt), ACT_DT))
         
         # ACT_DT -> Chi tiết outflow
-        if items["chi_mua_tscd"] < -threshold:
-            flows.append(f"{ACT_DT} [{to_b(abs(items['chi_mua_tscd']))}] Mua sắm TSCĐ")
-        if items["chi_cho_vay"] < -threshold:
-            flows.append(f"{ACT_DT} [{to_b(abs(items['chi_cho_vay']))}] Cho vay / mua công cụ nợ")
-        if items["thu_thanh_ly"] < -threshold:
-            flows.append(f"{ACT_DT} [{to_b(abs(items['thu_thanh_ly']))}] Thu thanh lý TSCĐ")
+        if items["chi_mua_tscd"] < 0:
+            flows.append((ACT_DT, abs(items['chi_mua_tscd']), "Mua sắm TSCĐ"))
+        if items["chi_cho_vay"] < 0:
+            flows.append((ACT_DT, abs(items['chi_cho_vay']), "Cho vay / mua công cụ nợ"))
+        if items["thu_thanh_ly"] < 0:
+            flows.append((ACT_DT, abs(items['thu_thanh_ly']), "Thu thanh lý TSCĐ"))
 
         # === HOẠT ĐỘNG TÀI CHÍNH ===
         # Chi tiết inflow -> ACT_TC
-        if items["thu_vay"] > threshold:
-            flows.append(f"Tiền vay nhận được [{to_b(items['thu_vay'])}] {ACT_TC}")
+        if items["thu_vay"] > 0:
+            flows.append(("Tiền vay nhận được", items['thu_vay'], ACT_TC))
         
         # ACT_TC net -> POOL (hoặc ngược lại)
         if net_tc > threshold:
-            flows.append(f"{ACT_TC} [{to_b(net_tc)}] {POOL}")
+            flows.append((ACT_TC, net_tc, POOL))
         elif net_tc < -threshold:
-            flows.append(f"{POOL} [{to_b(abs(net_tc))}] {ACT_TC}")
+            flows.append((POOL, abs(net_tc), ACT_TC))
         
         # ACT_TC -> Chi tiết outflow
-        if items["chi_tra_goc_vay"] < -threshold:
-            flows.append(f"{ACT_TC} [{to_b(abs(items['chi_tra_goc_vay']))}] Trả nợ gốc")
-        if items["chi_tra_co_tuc"] < -threshold:
-            flows.append(f"{ACT_TC} [{to_b(abs(items['chi_tra_co_tuc']))}] Trả cổ tức")
+        if items["chi_tra_goc_vay"] < 0:
+            flows.append((ACT_TC, abs(items['chi_tra_goc_vay']), "Trả nợ gốc"))
+        if items["chi_tra_co_tuc"] < 0:
+            flows.append((ACT_TC, abs(items['chi_tra_co_tuc']), "Trả cổ tức"))
 
         # === TIỀN CUỐI KỲ ===
-        if items["cuoi_ky"] > threshold:
-            flows.append(f"{POOL} [{to_b(items['cuoi_ky'])}] Tiền cuối kỳ")
+        if items["cuoi_ky"] > 0:
+            flows.append((POOL, items['cuoi_ky'], "Tiền cuối kỳ"))
 
         # === TỶ GIÁ ===
-        if items["ty_gia"] > threshold:
-            flows.append(f"Chênh lệch tỷ giá [{to_b(items['ty_gia'])}] {POOL}")
-        elif items["ty_gia"] < -threshold:
-            flows.append(f"{POOL} [{to_b(abs(items['ty_gia']))}] Chênh lệch tỷ giá")
-
-        return '\n'.join(dict.fromkeys(flows))
+        if items["ty_gia"] > 0:
+            flows.append(("Chênh lệch tỷ giá", items['ty_gia'], POOL))
+        elif items["ty_gia"] < 0:
+            flows.append((POOL, abs(items['ty_gia']), "Chênh lệch tỷ giá"))
+
+        # Luồng chi tiết nhỏ hơn ngưỡng được gộp vào nút "Khác (<nút>)" để tổng các nút cha không đổi
+        lines = [f"{source} [{to_b(value)}] {target}"
+                 for source, value, target in fold_small_flows(flows, threshold) if to_b(value) > 0]
+        return '\n'.join(dict.fromkeys(lines))
 
     except Exception as e:
         return f"// Error: {str(e)}"
@@ -3,9 +3,66 @@ Data fetcher module for vnstock integration
 Fetches financial data from vnstock and converts it to the format expected by the Sankey generators
 """
 
-import pandas as pd
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+
 from vnstock import Vnstock
 
+import sources
+from cache import LRUCache
+from derived_periods import PeriodResolver, TTM, statement_period_type
+
+# Statements per (symbol, report_type, period_type). KBS returns every available
+# period in one frame, so any year/quarter/threshold for the same statement reuses it.
+# Entries are compact Statement objects (see statement.py), not the upstream DataFrames.
+STATEMENT_CACHE = LRUCache(
+    maxsize=int(os.environ.get('STATEMENT_CACHE_SIZE', 256)),
+    ttl=int(os.environ.get('STATEMENT_CACHE_TTL', 6 * 3600)),
+)
+
+# Source strategy: primary first, the next one is fired if the primary has not answered
+# within SANKEY_HEDGE_MS (or failed). e.g. SANKEY_SOURCES=KBS,VCI SANKEY_HEDGE_MS=1500
+SOURCES = [name.strip().upper() for name in os.environ.get('SANKEY_SOURCES', 'KBS').split(',')
+           if name.strip().upper() in sources.NORMALIZERS] or ['KBS']
+HEDGE_DELAY = float(os.environ.get('SANKEY_HEDGE_MS', 1500)) / 1000
+# At most MAX_HEDGES extra calls in flight per process: under load, when every source is slow,
+# hedging would only add upstream traffic, so a fetch then just waits for its primary.
+MAX_HEDGES = int(os.environ.get('SANKEY_MAX_HEDGES', 4))
+_HEDGE_SLOTS = threading.BoundedSemaphore(max(1, MAX_HEDGES))
+# Sized for SANKEY_MAX_CONCURRENT_REQUESTS requests fetching their 3 reports at once, plus the
+# hedges, so fetches do not queue behind each other (threads are only started when needed)
+_FETCH_WORKERS = int(os.environ.get('SANKEY_MAX_CONCURRENT_REQUESTS', 8)) * 3 + MAX_HEDGES
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix='fetch')
+
+
+class SourceStats:
+    """Counters for /api/health: wins per source, hedged and failed-over fetches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'hedged': 0, 'hedges_skipped': 0, 'failovers': 0, 'wins': {}}
+
+    def record(self, kind, source=None):
+        with self._lock:
+            if source is None:
+                self.counts[kind] += 1
+            else:
+                self.counts[kind][source] = self.counts[kind].get(source, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {'sources': SOURCES, 'hedge_ms': HEDGE_DELAY * 1000, 'max_hedges': MAX_HEDGES,
+                    'fetch_workers': _FETCH_WORKERS,
+                    'hedged': self.counts['hedged'], 'hedges_skipped': self.counts['hedges_skipped'],
+                    'failovers': self.counts['failovers'], 'wins': dict(self.counts['wins'])}
+
+
+SOURCE_STATS = SourceStats()
+
 # Register API key for authenticated access (60 requests/min vs 20 for guests)
 # Introduced in vnstock 3.4.0+
 try:
@@ -16,6 +73,352 @@ except Exception as e:
     print(f"⚠️ Warning: Could not register API key: {e}")
     print("Continuing with guest access (20 requests/min limit)")
 
+def _default_client_factory(symbol, source):
+    return Vnstock().stock(symbol=symbol, source=source)
+
+
+_client_factory = _default_client_factory
+
+
+class ClientPool:
+    """
+    Idle vnstock stock clients per (source, symbol), reused across requests.
+
+    A client is checked out for one fetch and handed back afterwards, so two threads never
+    share one. At most maxsize idle clients are kept (least recently used dropped first) and
+    clients older than ttl seconds are rebuilt. A client whose fetch raised is discarded
+    instead of handed back, so a half-broken client is never reused.
+    """
+
+    def __init__(self, maxsize=64, ttl=None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._idle = OrderedDict()  # (source, symbol) -> [(created_at, client), ...]
+        self._idle_count = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.evictions = 0
+
+    def _checkout(self, key):
+        with self._lock:
+            clients = self._idle.get(key)
+            while clients:
+                created_at, stock = clients.pop()
+                self._idle_count -= 1
+                if self.ttl is None or time.monotonic() - created_at < self.ttl:
+                    self.reused += 1
+                    return created_at, stock
+                self.evictions += 1
+            self._idle.pop(key, None)
+            return None, None
+
+    def _checkin(self, key, created_at, stock):
+        with self._lock:
+            self._idle.setdefault(key, []).append((created_at, stock))
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            while self._idle_count > self.maxsize:
+                oldest_key, clients = next(iter(self._idle.items()))
+                clients.pop(0)
+                self._idle_count -= 1
+                self.evictions += 1
+                if not clients:
+                    del self._idle[oldest_key]
+
+    @contextmanager
+    def client(self, symbol, source):
+        """with CLIENT_POOL.client('VNM', 'KBS') as stock: stock.finance..."""
+        key = (source, symbol)
+        created_at, stock = self._checkout(key)
+        if stock is None:
+            stock = _client_factory(symbol, source)
+            created_at = time.monotonic()
+            with self._lock:
+                self.created += 1
+        try:
+            yield stock
+        except Exception:
+            with self._lock:
+                self.recycled += 1
+            raise
+        self._checkin(key, created_at, stock)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self._idle_count = 0
+
+    def stats(self):
+        """Return counters for health/debug output"""
+        with self._lock:
+            return {
+                'idle': self._idle_count,
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'created': self.created,
+                'reused': self.reused,
+                'recycled': self.recycled,
+                'evictions': self.evictions,
+            }
+
+
+CLIENT_POOL = ClientPool(
+    maxsize=int(os.environ.get('CLIENT_POOL_SIZE', 64)),
+    ttl=int(os.environ.get('CLIENT_POOL_TTL', 3600)),
+)
+
+
+# vnstock's source modules call requests.get()/requests.request() directly, and each of those
+# opens and closes a throwaway Session (new TCP + TLS handshake per call). Inside
+# keepalive_scope() (i.e. during a vnstock fetch) those calls go through a pooled Session
+# instead, so connections stay alive across requests; every other caller of requests is
+# left untouched.
+class SessionPool:
+    """
+    Idle requests.Session objects shared by all threads.
+
+    A session is checked out for one fetch and handed back afterwards, so two threads never
+    share one. At most maxsize idle sessions are kept; surplus sessions are closed.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = max(1, int(maxsize))
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    @contextmanager
+    def session(self):
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+            if session is not None:
+                self.reused += 1
+        if session is None:
+            import requests
+            session = requests.Session()
+            with self._lock:
+                self.created += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                keep = len(self._idle) < self.maxsize
+                if keep:
+                    self._idle.append(session)
+                else:
+                    self.closed += 1
+            if not keep:
+                session.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.closed += len(idle)
+        for session in idle:
+            session.close()
+
+    def stats(self):
+        """Return counters for health/debug output"""
+        with self._lock:
+            return {
+                'enabled': _original_request is not None,
+                'idle': len(self._idle),
+                'maxsize': self.maxsize,
+                'created': self.created,
+                'reused': self.reused,
+                'closed': self.closed,
+            }
+
+
+SESSION_POOL = SessionPool(maxsize=int(os.environ.get('VNSTOCK_SESSION_POOL_SIZE', 16)))
+
+_scope = threading.local()
+_original_request = None
+
+
+def _keepalive_request(method, url, **kwargs):
+    session = getattr(_scope, 'session', None)
+    if session is None:
+        return _original_request(method, url, **kwargs)
+    return session.request(method=method, url=url, **kwargs)
+
+
+@contextmanager
+def keepalive_scope():
+    """Route requests' module-level helpers through a pooled Session on this thread for the duration"""
+    if _original_request is None or getattr(_scope, 'session', None) is not None:
+        yield
+        return
+    with SESSION_POOL.session() as session:
+        _scope.session = session
+        try:
+            yield
+        finally:
+            _scope.session = None
+
+
+def enable_keepalive():
+    """Install the keepalive_scope() hook on requests' module-level helpers (get/post/request)"""
+    global _original_request
+    try:
+        import requests
+        import requests.api
+    except ImportError:
+        return False
+    if _original_request is None:
+        _original_request = requests.api.request
+        requests.api.request = _keepalive_request
+        requests.request = _keepalive_request
+    return True
+
+
+if os.environ.get('VNSTOCK_KEEPALIVE', '1') != '0' and enable_keepalive():
+    print(f"✅ vnstock HTTP keep-alive enabled (up to {SESSION_POOL.maxsize} pooled sessions)")
+
+
+def set_client_factory(factory):
+    """
+    Replace how vnstock stock clients are built: factory(symbol, source) -> object with .finance
+    Used by the load-test harness to serve from a local fake source.
+    """
+    global _client_factory
+    _client_factory = factory or _default_client_factory
+    CLIENT_POOL.clear()
+
+
+def fetch_from_source(source, symbol, report_type, period_type):
+    """One source, one statement: pooled client call + normalization (see sources.py)"""
+    with keepalive_scope(), CLIENT_POOL.client(symbol, source) as stock:
+        df = sources.fetch_frame(stock, source, report_type, period_type)
+    return sources.normalize(source, df, period_type)
+
+
+def fetch_hedged(symbol, report_type, period_type):
+    """
+    Fetch from SOURCES in order with hedging.
+
+    The primary source gets HEDGE_DELAY seconds, counted from when its call starts running
+    (not from when it was queued); if it has not answered by then, the next source is started
+    as well and the first usable answer wins, unless MAX_HEDGES hedges are already in flight.
+    A source that fails or returns nothing starts the next one immediately. Losing calls
+    finish in the background (or are cancelled if still queued) and are ignored. Raises when
+    every source failed with an error.
+
+    Returns:
+        tuple: (Statement, source name), or (None, None) if the sources answered without data
+    """
+    if len(SOURCES) == 1:
+        # Nothing to hedge with: call inline (keeps the fetch on the request thread)
+        statement = fetch_from_source(SOURCES[0], symbol, report_type, period_type)
+        if statement is None or not len(statement):
+            return None, None
+        SOURCE_STATS.record('wins', SOURCES[0])
+        return statement, SOURCES[0]
+
+    pending = {}
+    started = {}  # source -> time.monotonic() when its call began running
+    errors = []
+    remaining = list(SOURCES)
+    can_hedge = True
+
+    def launch(reason):
+        source = remaining.pop(0)
+        if reason:
+            SOURCE_STATS.record(reason)
+
+        def call():
+            started[source] = time.monotonic()
+            return fetch_from_source(source, symbol, report_type, period_type)
+
+        future = _HEDGE_EXECUTOR.submit(call)
+        if reason == 'hedged':
+            future.add_done_callback(lambda _: _HEDGE_SLOTS.release())
+        pending[future] = source
+        return source
+
+    latest = launch(None)
+    try:
+        while pending:
+            timeout = None
+            if remaining and can_hedge:
+                began = started.get(latest)
+                timeout = HEDGE_DELAY if began is None else max(0.0, began + HEDGE_DELAY - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                began = started.get(latest)
+                if began is None or time.monotonic() - began < HEDGE_DELAY:
+                    continue  # still queued, or woke up early: the clock has not run out
+                if not _HEDGE_SLOTS.acquire(blocking=False):
+                    SOURCE_STATS.record('hedges_skipped')
+                    can_hedge = False
+                    continue
+                print(f"⏱️ {symbol} {report_type}: no answer within {HEDGE_DELAY * 1000:.0f} ms, hedging with {remaining[0]}")
+                latest = launch('hedged')
+                continue
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    statement = future.result()
+                except Exception as e:
+                    errors.append(f"{source}: {e}")
+                    continue
+                if statement is not None and len(statement):
+                    SOURCE_STATS.record('wins', source)
+                    return statement, source
+            if not pending and remaining:
+                latest = launch('failovers')
+    finally:
+        for future in pending:
+            future.cancel()  # only succeeds for calls that have not started yet
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return None, None
+
+
+def fetch_raw_statement(symbol, report_type, period_type):
+    """
+    Fetch a full statement (items as rows, periods as columns), using STATEMENT_CACHE
+
+    Args:
+        symbol (str): Stock symbol
+        report_type (str): 'balance', 'income' or 'cashflow'
+        period_type (str): 'year' or 'quarter'
+
+    Returns:
+        Statement: every available period, values in VND, or None if no source returned data
+    """
+    key = (symbol.upper(), report_type.lower(), period_type)
+    statement = STATEMENT_CACHE.get(key)
+    if statement is not None:
+        return statement
+
+    if report_type.lower() not in sources.REPORT_METHODS:
+        raise ValueError(f"Invalid report type: {report_type}")
+
+    # KBS (the default primary) returns detailed items according to Circular 200, but limited
+    # history (5 periods); every source is normalized to the same Statement shape and VND
+    statement, source = fetch_hedged(symbol.upper(), report_type.lower(), period_type)
+    if statement is None:
+        return None
+
+    STATEMENT_CACHE.set(key, statement)
+    return statement
+
+
+def _load_annual(symbol, report_type):
+    """Annual statement for deriving a Q4; a failure only disables the derivation"""
+    try:
+        return fetch_raw_statement(symbol, report_type, 'year')
+    except Exception as e:
+        print(f"⚠️ Annual {report_type} for {symbol} unavailable, cannot derive Q4: {e}")
+        return None
+
+
 def fetch_financial_data(symbol, report_type, period, year):
     """
     Fetch financial data from vnstock
@@ -23,36 +426,37 @@ def fetch_financial_data(symbol, report_type, period, year):
     Args:
         symbol (str): Stock symbol (e.g., 'VNM', 'VCB')
         report_type (str): Type of report ('balance', 'income', 'cashflow')
-        period (str): Period ('Q1', 'Q2', 'Q3', 'Q4', 'year')
+        period (str): Period ('Q1', 'Q2', 'Q3', 'Q4', 'year', or 'TTM' = trailing twelve months)
         year (int): Year (e.g., 2024)
     
     Returns:
-        pandas.DataFrame: Financial data in the format expected by Sankey generators
+        tuple: (Statement with only the selected period, selected period name)
     """
     try:
-        # Initialize vnstock with KBS source (best for detailed financial reports in v3.4.1)
-        # KBS returns detailed items according to Circular 200, but limited history (5 periods)
-        stock = Vnstock().stock(symbol=symbol.upper(), source='KBS')
-        
         # Determine period type (NAM/year/yearly for yearly, otherwise quarter)
-        period_lower = period.lower()
-        period_type = 'year' if period_lower in ['year', 'nam', 'yearly'] else 'quarter'
+        period_type = statement_period_type(period)
         
-        # Fetch data. KBS returns "long" format: items as rows, periods as columns
-        if report_type.lower() == 'balance':
-            df = stock.finance.balance_sheet(period=period_type)
-        elif report_type.lower() == 'income':
-            df = stock.finance.income_statement(period=period_type)
-        elif report_type.lower() == 'cashflow':
-            df = stock.finance.cash_flow(period=period_type)
-        else:
-            raise ValueError(f"Invalid report type: {report_type}")
+        statement = fetch_raw_statement(symbol, report_type, period_type)
         
-        if df is None or df.empty:
+        if statement is None or not len(statement):
             raise ValueError(f"No data available for {symbol} - {report_type} - {period}")
 
-        # --- Data Mapping Layer for KBS (Long format) ---
-        # 1. Selection logic: KBS uses columns like '2024-Q3' or '2024'
+        # Derived periods (TTM, or a Q4 only published inside the annual report) come from the
+        # cached quarterly statement plus, only when a Q4 is missing, the cached annual one
+        resolver = None
+        if period_type == 'quarter':
+            resolver = PeriodResolver(report_type, statement, lambda: _load_annual(symbol, report_type))
+
+        if period.upper() == TTM:
+            derived = resolver.ttm(year)
+            if derived is None:
+                raise ValueError(f"Not enough quarterly data for {TTM} ({symbol} - {report_type} - {year})")
+            selected, target_col = derived
+            print(f"✅ Derived {target_col} for {symbol} ({report_type}) from cached statements")
+            return selected, target_col
+
+        # --- Data Mapping Layer (every source is normalized to the KBS long format) ---
+        # 1. Selection logic: periods look like '2024-Q3' or '2024'
         if period_type == 'year':
             target_col = str(year)
         else:
@@ -60,32 +464,36 @@ def fetch_financial_data(symbol, report_type, period, year):
             q_code = period.upper() if 'Q' in period.upper() else f"Q{period}"
             target_col = f"{year}-{q_code}"
             
-        if target_col not in df.columns:
+        if target_col not in statement.periods and target_col.endswith('-Q4'):
+            # Q4 not published on its own: annual - (Q1 + Q2 + Q3)
+            derived = resolver.q4(year)
+            if derived is not None:
+                selected, target_col = derived
+                print(f"✅ Derived {target_col} for {symbol} from the annual report")
+                return selected, target_col
+
+        if target_col not in statement.periods:
             # Fallback: Find the most recent column that starts with the year
-            year_cols = [c for c in df.columns if c.startswith(str(year))]
+            year_cols = [c for c in statement.periods if c.startswith(str(year))]
             if year_cols:
                 # Sort to get the latest (X-Q4 > X-Q1)
                 target_col = sorted(year_cols, reverse=True)[0]
                 print(f"⚠️ {target_col} not found exactly. Using {target_col} instead.")
             else:
-                # Fallback to the latest available column overall (ignoring metadata)
-                meta_cols = ['ticker', 'item', 'item_id', 'Năm', 'Kỳ']
-                data_cols = [c for c in df.columns if c not in meta_cols]
+                # Fallback to the latest available column overall (metadata columns were
+                # already dropped when building the Statement)
+                data_cols = statement.periods
                 if data_cols:
                     target_col = data_cols[0] # Usually KBS returns latest first
                     print(f"⚠️ Year {year} not found. Using latest available: {target_col}")
                 else:
                     raise ValueError(f"No numeric data columns found for {symbol}")
 
-        # 2. Extract 'item' and the target column
-        # KBS returns data in THOUSAND VND, so we multiply by 1000 to get VND
-        # this ensures compatibility with the extraction modules which expect VND
-        transposed = df[['item', target_col]].copy()
-        transposed.columns = ['CHỈ TIÊU', 'VALUE']
-        transposed['VALUE'] = transposed['VALUE'] * 1000
+        # 2. Select the target period (shares labels and values with the cached statement, no copy)
+        selected = statement.select(target_col)
         
-        print(f"✅ Successfully fetched and transformed KBS data for {symbol} ({target_col})")
-        return transposed, target_col
+        print(f"✅ Successfully fetched and transformed data for {symbol} ({target_col})")
+        return selected, target_col
                 
     except Exception as e:
         print(f"❌ Failed to fetch data for {symbol}: {str(e)}")
@@ -0,0 +1,195 @@
+"""
+Derived periods computed from cached statements, so no extra period data is needed upstream
+
+    Q4  = annual - (Q1 + Q2 + Q3)    when KBS publishes the year but not the fourth quarter
+    TTM = sum of the last four quarters (trailing twelve months)
+
+Flow rows (income statement, cash flow) are added or subtracted. Point-in-time rows are not:
+the balance sheet takes the period-end column, and in the cash flow the opening cash comes
+from the first quarter of the window and the closing cash from the last.
+"""
+
+import math
+import re
+from array import array
+
+import cashflow
+from label_matcher import LabelMatcher
+from statement import Statement
+
+TTM = 'TTM'
+
+# Period names that select the annual statement; anything else (Q1..Q4, TTM) is quarterly
+YEAR_PERIODS = ('year', 'nam', 'yearly')
+
+QUARTER_RE = re.compile(r'^(\d{4})-Q([1-4])$')
+
+
+def statement_period_type(period):
+    """'year' or 'quarter': which upstream statement a requested period is read from"""
+    return 'year' if period.lower() in YEAR_PERIODS else 'quarter'
+
+
+# Cash flow rows that are balances rather than flows
+_CASH_MATCHER = LabelMatcher({
+    'opening': cashflow.CASHFLOW_ITEMS['dau_ky'],
+    'closing': cashflow.CASHFLOW_ITEMS['cuoi_ky'],
+})
+
+
+def parse_quarter(period):
+    """'2024-Q3' -> (2024, 3); None for anything else"""
+    match = QUARTER_RE.match(period)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _shift(year, quarter, n):
+    index = year * 4 + quarter - 1 + n
+    return index // 4, index % 4 + 1
+
+
+def _row_keys(labels):
+    """(label, occurrence) per row, so a label repeated in two sections stays distinct"""
+    seen = {}
+    keys = []
+    for label in labels:
+        n = seen.get(label, 0)
+        seen[label] = n + 1
+        keys.append((label, n))
+    return keys
+
+
+def _aligned(labels, statement, period):
+    """statement[period] reordered to `labels` (NaN where a row is missing)"""
+    values = statement.column(period)
+    if statement.labels == labels:
+        return values
+    index = {key: row for row, key in enumerate(_row_keys(statement.labels))}
+    return array('d', (values[index[key]] if key in index else math.nan for key in _row_keys(labels)))
+
+
+def _sum(columns):
+    """Row-wise sum treating NaN as 0, NaN only where every input is missing"""
+    result = array('d', bytes(8 * len(columns[0])))
+    for row in range(len(result)):
+        cells = [column[row] for column in columns if not math.isnan(column[row])]
+        result[row] = math.fsum(cells) if cells else math.nan
+    return result
+
+
+def _subtract(total, parts):
+    """total - parts row by row (missing parts count as 0, a missing total stays missing)"""
+    result = array('d', total)
+    for row, value in enumerate(_sum(parts)):
+        if not math.isnan(value):
+            result[row] -= value
+    return result
+
+
+def _set_cash(labels, values, opening=None, closing=None):
+    """Overwrite the opening/closing cash rows of a derived cash flow column"""
+    rows = _CASH_MATCHER.match(labels)
+    if opening is not None and rows['opening'] is not None:
+        values[rows['opening']] = opening
+    if closing is not None and rows['closing'] is not None:
+        values[rows['closing']] = closing
+
+
+def _cash(labels, values, which):
+    row = _CASH_MATCHER.match(labels)[which]
+    return None if row is None else values[row]
+
+
+class PeriodResolver:
+    """
+    Quarter columns for one (report_type, quarterly statement), deriving Q4 from the annual
+    statement when needed. The annual statement is only loaded (load_annual()) if a Q4 is
+    actually missing.
+    """
+
+    def __init__(self, report_type, quarterly, load_annual):
+        self.report_type = report_type
+        self.quarterly = quarterly
+        self.labels = quarterly.labels
+        self._load_annual = load_annual
+        self._annual = None
+        self._annual_loaded = False
+        self.derived = []
+
+    @property
+    def annual(self):
+        if not self._annual_loaded:
+            self._annual = self._load_annual()
+            self._annual_loaded = True
+        return self._annual
+
+    def quarter(self, year, quarter):
+        """Values for year-Qn aligned to the quarterly labels, or None if unavailable"""
+        name = f"{year}-Q{quarter}"
+        if name in self.quarterly.periods:
+            return self.quarterly.column(name)
+        if quarter != 4 or self.annual is None or str(year) not in self.annual.periods:
+            return None
+
+        annual = _aligned(self.labels, self.annual, str(year))
+        if self.report_type == 'balance':
+            # Year-end balance is the Q4-end balance
+            self.derived.append(name)
+            return annual
+
+        parts = [self.quarter(year, q) for q in (1, 2, 3)]
+        if any(part is None for part in parts):
+            return None
+        values = _subtract(annual, parts)
+        if self.report_type == 'cashflow':
+            _set_cash(self.labels, values,
+                      opening=_cash(self.labels, parts[2], 'closing'),
+                      closing=_cash(self.labels, annual, 'closing'))
+        self.derived.append(name)
+        return values
+
+    def latest_quarter(self, year):
+        """Latest quarter of `year` that is published or derivable, else the latest published overall"""
+        published = sorted(q for q in map(parse_quarter, self.quarterly.periods) if q)
+        if not published:
+            return None
+        in_year = [q for q in published if q[0] == int(year)]
+        if not in_year:
+            return published[-1]
+        if in_year[-1][1] == 3 and self.quarter(int(year), 4) is not None:
+            return int(year), 4
+        return in_year[-1]
+
+    def ttm(self, year):
+        """
+        Trailing twelve months ending at latest_quarter(year).
+
+        Returns:
+            tuple: (single-column Statement, period name like 'TTM 2024-Q4'), or None
+        """
+        end = self.latest_quarter(year)
+        if end is None:
+            return None
+        window = [_shift(end[0], end[1], n) for n in (-3, -2, -1, 0)]
+        columns = [self.quarter(y, q) for y, q in window]
+        if any(column is None for column in columns):
+            return None
+
+        name = f"{TTM} {end[0]}-Q{end[1]}"
+        if self.report_type == 'balance':
+            values = columns[-1]
+        else:
+            values = _sum(columns)
+            if self.report_type == 'cashflow':
+                _set_cash(self.labels, values,
+                          opening=_cash(self.labels, columns[0], 'opening'),
+                          closing=_cash(self.labels, columns[-1], 'closing'))
+        return Statement(self.labels, (name,), (values,)), name
+
+    def q4(self, year):
+        """Derived '{year}-Q4' as (single-column Statement, period name), or None"""
+        values = self.quarter(int(year), 4)
+        if values is None:
+            return None
+        name = f"{year}-Q4"
+        return Statement(self.labels, (name,), (values,)), name
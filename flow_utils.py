@@ -0,0 +1,228 @@
+"""
+Post-processing helpers for SankeyMATIC flow text
+Parses "Source [value] Target" lines and merges small flows into "Khác" nodes
+"""
+
+import re
+
+# Display units accepted by the API (request param "unit")
+UNIT_FACTORS = {
+    'billion': 1_000_000_000,   # Tỷ VNĐ (default)
+    'million': 1_000_000,       # Triệu VNĐ
+}
+DEFAULT_UNIT = 'billion'
+
+OTHER_LABEL = "Khác"
+
+_FLOW_RE = re.compile(r'^(.+?)\s+\[([-\d.]+)\]\s+(.+)$')
+
+
+def parse_flow_options(data):
+    """
+    Read optional graph-shaping parameters from an API payload (or CLI options dict)
+
+    - threshold: fraction of the report's reference total below which flows are hidden
+    - unit: 'billion' (default) or 'million'
+    - max_flows_per_node: merge the smallest leaf flows of a node into a "Khác" node
+
+    Returns (extract_params, max_flows_per_node, unit). Raises ValueError on bad input.
+    """
+    extract_params = {}
+
+    threshold = data.get('threshold')
+    if threshold is not None:
+        try:
+            if isinstance(threshold, bool):
+                raise TypeError(threshold)
+            threshold = float(threshold)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid threshold. Must be a fraction between 0 and 1')
+        if not 0 <= threshold < 1:
+            raise ValueError('Invalid threshold. Must be a fraction between 0 and 1')
+        extract_params['threshold'] = threshold
+
+    unit = data.get('unit') or DEFAULT_UNIT
+    if not isinstance(unit, str) or unit.strip().lower() not in UNIT_FACTORS:
+        raise ValueError(f"Invalid unit. Must be one of: {', '.join(UNIT_FACTORS)}")
+    unit = unit.strip().lower()
+    if unit != DEFAULT_UNIT:
+        extract_params['unit_factor'] = UNIT_FACTORS[unit]
+
+    max_flows = data.get('max_flows_per_node')
+    if max_flows is not None:
+        if isinstance(max_flows, float) and max_flows.is_integer():
+            max_flows = int(max_flows)
+        if isinstance(max_flows, str) and max_flows.strip().isdigit():
+            max_flows = int(max_flows)
+        if isinstance(max_flows, bool) or not isinstance(max_flows, int):
+            raise ValueError('Invalid max_flows_per_node. Must be an integer of at least 2')
+        if max_flows < 2:
+            raise ValueError('Invalid max_flows_per_node. Must be at least 2')
+
+    return extract_params, max_flows, unit
+
+
+def parse_flows(text):
+    """
+    Parse SankeyMATIC text into a list of (source, value, target) tuples.
+    Comments and malformed lines are skipped.
+    """
+    flows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        match = _FLOW_RE.match(line)
+        if match:
+            flows.append((match.group(1).strip(), float(match.group(2)), match.group(3).strip()))
+    return flows
+
+
+def flows_to_graph(text):
+    """
+    Convert SankeyMATIC text into {"nodes": [...], "links": [...]} with index-based links,
+    node order following first appearance (same convention as parseSankeyData in app.js)
+    """
+    nodes, index = [], {}
+    links = []
+    for source, value, target in parse_flows(text):
+        if value <= 0:
+            continue
+        for name in (source, target):
+            if name not in index:
+                index[name] = len(nodes)
+                nodes.append({'name': name})
+        links.append({'source': index[source], 'target': index[target], 'value': value})
+    return {'nodes': nodes, 'links': links}
+
+
+def format_flows(flows):
+    """Inverse of parse_flows"""
+    lines = []
+    for source, value, target in flows:
+        value = int(value) if float(value).is_integer() else round(value, 3)
+        lines.append(f"{source} [{value}] {target}")
+    return "\n".join(lines)
+
+
+def other_label(node, direction):
+    """
+    Name of the node collecting merged leaf flows of `node`: "Khác (<node>)" for its
+    outflows, "Khác (nguồn <node>)" for its inflows. The names must differ, otherwise a
+    node with both would form the cycle Khác (X) -> X -> Khác (X).
+    """
+    if direction == 'in':
+        return f"{OTHER_LABEL} (nguồn {node})"
+    return f"{OTHER_LABEL} ({node})"
+
+
+def _leaf_checks(flows):
+    """(is_endpoint, is_origin) predicates for the graph formed by `flows`"""
+    in_count, out_count = {}, {}
+    for source, _, target in flows:
+        out_count[source] = out_count.get(source, 0) + 1
+        in_count[target] = in_count.get(target, 0) + 1
+
+    def is_endpoint(node):
+        return out_count.get(node, 0) == 0 and in_count.get(node, 0) == 1
+
+    def is_origin(node):
+        return in_count.get(node, 0) == 0 and out_count.get(node, 0) == 1
+
+    return is_endpoint, is_origin
+
+
+def fold_small_flows(flows, threshold_value):
+    """
+    Apply an extractor's threshold to (source, value, target) flows.
+
+    Flows of at least threshold_value are kept. Smaller leaf flows (into an endpoint or
+    from an origin, see prune_flows) are summed per node into one "Khác" flow (see
+    other_label) so the node total is unchanged; a node with a single small leaf keeps it as is. Other
+    small flows and non-positive values are dropped.
+    """
+    flows = [flow for flow in flows if flow[1] > 0]
+    is_endpoint, is_origin = _leaf_checks(flows)
+
+    small = {}  # (node, direction) -> indexes of small leaf flows
+    for i, (source, value, target) in enumerate(flows):
+        if value >= threshold_value:
+            continue
+        if is_endpoint(target):
+            small.setdefault((source, 'out'), []).append(i)
+        elif is_origin(source):
+            small.setdefault((target, 'in'), []).append(i)
+
+    kept = {i for i, flow in enumerate(flows) if flow[1] >= threshold_value}
+    extra = {}
+    for (node, direction), indexes in small.items():
+        if len(indexes) == 1:
+            kept.add(indexes[0])
+            continue
+        total = sum(flows[i][1] for i in indexes)
+        other = other_label(node, direction)
+        extra[indexes[0]] = (node, total, other) if direction == 'out' else (other, total, node)
+
+    result = []
+    for i, flow in enumerate(flows):
+        if i in extra:
+            result.append(extra[i])
+        elif i in kept:
+            result.append(flow)
+    return result
+
+
+def prune_flows(text, max_flows_per_node):
+    """
+    Limit the number of flows attached to each node.
+
+    Only leaf flows can be merged: outgoing flows into endpoints (nodes with no
+    outgoing flows and a single incoming flow) and incoming flows from origins
+    (nodes with no incoming flows and a single outgoing flow). For each node the
+    largest of those are kept and the rest are summed into one "Khác" flow (see
+    other_label), so node totals and the rest of the graph stay unchanged. If the node
+    already has that flow (from fold_small_flows), the rest is added to it rather
+    than to a second, parallel one.
+    """
+    if not max_flows_per_node or not text or text.startswith('// Error'):
+        return text
+
+    flows = parse_flows(text)
+    is_endpoint, is_origin = _leaf_checks(flows)
+
+    merged = set()  # indexes of flows folded into an "Khác" node
+    extra = {}  # position of the first merged flow -> replacement "Khác" flow
+    for direction in ('out', 'in'):
+        by_node = {}
+        for i, (source, value, target) in enumerate(flows):
+            node, other = (source, target) if direction == 'out' else (target, source)
+            by_node.setdefault(node, []).append((i, value, other))
+
+        for node, attached in by_node.items():
+            if len(attached) <= max_flows_per_node:
+                continue
+            leaf_check = is_endpoint if direction == 'out' else is_origin
+            leaves = [a for a in attached if leaf_check(a[2]) and a[0] not in merged]
+            # Keep (max - 1) flows overall so the merged node fits in the budget
+            overflow = len(attached) - max_flows_per_node + 1
+            if overflow < 2 or len(leaves) < 2:
+                continue
+            other = other_label(node, direction)
+            # An existing "Khác" leaf of this node is always merged, whatever its size
+            existing = [a for a in leaves if a[2] == other]
+            leaves = sorted((a for a in leaves if a[2] != other), key=lambda a: a[1])
+            to_merge = existing + leaves[:overflow - len(existing)]
+            merged.update(i for i, _, _ in to_merge)
+            total = sum(value for _, value, _ in to_merge)
+            position = min(i for i, _, _ in to_merge)
+            extra[position] = (node, total, other) if direction == 'out' else (other, total, node)
+
+    if not merged:
+        return text
+    result = []
+    for i, flow in enumerate(flows):
+        if i in extra:
+            result.append(extra[i])
+        if i not in merged:
+            result.append(flow)
+    return format_flows(result)
@@ -1,99 +1,103 @@
-import pandas as pd
+import math
 import os
-import re
 
-def normalize_text(text):
+from flow_utils import fold_small_flows
+from label_matcher import LabelMatcher
+from statement import as_statement
+
+# Tăng số này mỗi khi thay đổi logic trích xuất để làm mới cache kết quả (xem cache.py)
+EXTRACTOR_VERSION = 4
+
+# Ngưỡng hiển thị mặc định: 0.1% lợi nhuận sau thuế để bắt được nhiều chi tiết hơn
+THRESHOLD_PERCENT = 0.001
+
+# Các chỉ tiêu cần trích xuất và tên đồng nghĩa (tên chuẩn trong vnstock v3.4.1)
+INCOME_ITEMS = {
+    "doanh_thu_thuan": ["Doanh thu thuần về bán hàng và cung cấp dịch vụ", "Doanh thu thuần", "Doanh thu"],
+    "gia_von_hang_ban": ["Giá vốn hàng bán"],
+    "loi_nhuan_gop": ["Lợi nhuận gộp về bán hàng và cung cấp dịch vụ", "Lợi nhuận gộp", "Lãi gộp"],
+    "doanh_thu_tai_chinh": ["Doanh thu hoạt động tài chính", "Thu nhập tài chính", "Thu nhập lãi"],
+    "chi_phi_tai_chinh": ["Chi phí tài chính", "Chi phí tiền lãi vay"],
+    "chi_phi_ban_hang": ["Chi phí bán hàng"],
+    "chi_phi_quan_ly": ["Chi phí quản lý doanh nghiệp", "Chi phí quản lý DN"],
+    "loi_nhuan": ["Lợi nhuận thuần từ hoạt động kinh doanh", "Lãi/Lỗ từ hoạt động kinh doanh", "LN trước thuế"],
+    "loi_nhuan_khac": ["Lợi nhuận khác"],
+    "thue_thu_nhap": ["Chi phí thuế TNDN hiện hành"],
+    "loi_nhuan_sau_thue": ["Lợi nhuận sau thuế thu nhập doanh nghiệp", "Lợi nhuận thuần", "Lợi nhuận sau thuế của Cổ đông công ty mẹ (đồng)"],
+}
+# Các khoản chi phí: lấy trị tuyệt đối trước khi làm tròn
+COST_ITEMS = {"gia_von_hang_ban", "chi_phi_tai_chinh", "chi_phi_ban_hang", "chi_phi_quan_ly", "thue_thu_nhap"}
+
+# Biên dịch toàn bộ tên đồng nghĩa một lần; reverse=True để bắt nhãn VCI (suffix đồng)
+_MATCHER = LabelMatcher(INCOME_ITEMS, reverse=True)
+
+def _round_value(value, unit_factor, is_cost=False):
+    if not math.isnan(value):
+        value = abs(value) if is_cost else value
+        val_rounded = abs(round(value / unit_factor))
+        return val_rounded
+    return 0
+
+def extract_values(statement, column, unit_factor=1_000_000_000):
     """
-    Chuẩn hóa text để so sánh: bỏ số thứ tự, bỏ khoảng trắng dư, viết thường
+    Trích xuất toàn bộ chỉ tiêu trong INCOME_ITEMS bằng một lần quét nhãn.
+    statement: Statement (xem statement.py), column: tên kỳ
+    Trả về dict tên chỉ tiêu -> giá trị đã làm tròn (0 nếu không tìm thấy).
     """
-    if not isinstance(text, str):
-        return ""
-    # Bỏ các tiền tố như "I. ", "1. ", "A. ", "   - "
-    text = re.sub(r'^[A-Z0-9\.\s\-IXV]+[\.\s\-]+', '', text)
-    # Bỏ dấu ngoặc đơn và nội dung bên trong
-    text = re.sub(r'\s*\(.*\)', '', text)
-    # Bỏ khoảng trắng dư và chuyển về chữ thường
-    text = " ".join(text.split()).lower()
-    return text
+    rows = _MATCHER.match(statement.labels)
+    data = statement.column(column)
+    values = {}
+    for name, row in rows.items():
+        try:
+            values[name] = 0 if row is None else _round_value(data[row], unit_factor, name in COST_ITEMS)
+        except Exception as e:
+            print(f"Lỗi khi trích xuất {INCOME_ITEMS[name]}: {e}")
+            values[name] = 0
+    return values
 
 def safe_extract_value_and_round(df, chi_tieu_dao, column, unit_factor=1_000_000_000, is_cost=False):
     """
-    Trích xuất và làm tròn giá trị từ DataFrame bằng cách so sánh chuẩn hóa.
+    Trích xuất và làm tròn giá trị từ Statement/DataFrame bằng cách so sánh chuẩn hóa.
     chi_tieu_dao có thể là một chuỗi hoặc một list các chuỗi đồng nghĩa.
+    Dùng cho tra cứu lẻ; luồng chính dùng extract_values.
     """
     try:
-        # Chuyển thành list nếu chỉ là một chuỗi
-        if isinstance(chi_tieu_dao, str):
-            targets = [chi_tieu_dao]
-        else:
-            targets = chi_tieu_dao
-            
-        targets_norm = [normalize_text(t) for t in targets]
-        
-        # Tạo bản chuẩn hóa của cột CHỈ TIÊU để tìm kiếm
-        df_temp = df.copy()
-        df_temp["NORM"] = df_temp["CHỈ TIÊU"].apply(normalize_text)
-        
-        # Tìm kiếm khớp chính xác
-        row = df_temp.loc[df_temp["NORM"].isin(targets_norm)]
-        
-        if row.empty:
-            # Thử tìm kiếm mờ
-            for t_norm in targets_norm:
-                row = df_temp[df_temp["NORM"].str.contains(t_norm, na=False)]
-                if not row.empty:
-                    break
-        
-        if row.empty:
-            # Check ngược lại cho VCI (suffix đồng)
-            for t_norm in targets_norm:
-                mask = df_temp["NORM"].apply(lambda x: t_norm in x or x in t_norm)
-                row = df_temp[mask]
-                if not row.empty:
-                    break
-                    
-        if row.empty:
+        statement = as_statement(df)
+        row = LabelMatcher({"item": chi_tieu_dao}, reverse=True).match(statement.labels)["item"]
+        if row is None:
             return 0
-            
-        value = row[column].iloc[0]
-        if pd.notna(value):
-            value = abs(value) if is_cost else value
-            val_rounded = abs(round(value / unit_factor))
-            return val_rounded
-        return 0
+        return _round_value(statement.column(str(column))[row], unit_factor, is_cost)
     except Exception as e:
         print(f"Lỗi khi trích xuất {chi_tieu_dao}: {e}")
         return 0
 
-def extract_flows_from_dataframe(df):
+def extract_flows_from_dataframe(df, threshold=None, unit_factor=1_000_000_000):
     """
-    Xử lý DataFrame và trả về chuỗi flows cho SankeyMATIC.
-    df: pandas DataFrame với cột đầu tiên là tên chỉ tiêu
+    Xử lý báo cáo và trả về chuỗi flows cho SankeyMATIC.
+    df: Statement (từ data_fetcher) hoặc pandas DataFrame với cột đầu tiên là tên chỉ tiêu
+    threshold: tỷ lệ so với lợi nhuận sau thuế để lọc luồng nhỏ (mặc định THRESHOLD_PERCENT)
+    unit_factor: đơn vị hiển thị (1e9 = tỷ VND)
     """
     try:
-        # Đổi tên và làm sạch
-        if df.shape[1] < 2:
+        statement = as_statement(df)
+        if not statement.periods:
             return "// Error: DataFrame không đủ cột dữ liệu."
 
-        first_col_name = df.columns[0]
-        df = df.rename(columns={first_col_name: "CHỈ TIÊU"})
-        df["CHỈ TIÊU"] = df["CHỈ TIÊU"].astype(str).str.strip()
-        df = df.dropna(how='all')
-
-        first_numeric_column = df.columns[1]
+        first_numeric_column = statement.periods[0]
 
         # Trích xuất các giá trị (Sử dụng tên chuẩn trong vnstock v3.4.1)
-        doanh_thu_thuan = safe_extract_value_and_round(df, ["Doanh thu thuần về bán hàng và cung cấp dịch vụ", "Doanh thu thuần", "Doanh thu"], first_numeric_column)
-        gia_von_hang_ban = safe_extract_value_and_round(df, ["Giá vốn hàng bán"], first_numeric_column, is_cost=True)
-        loi_nhuan_gop = safe_extract_value_and_round(df, ["Lợi nhuận gộp về bán hàng và cung cấp dịch vụ", "Lợi nhuận gộp", "Lãi gộp"], first_numeric_column)
-        doanh_thu_tai_chinh = safe_extract_value_and_round(df, ["Doanh thu hoạt động tài chính", "Thu nhập tài chính", "Thu nhập lãi"], first_numeric_column)
-        chi_phi_tai_chinh = safe_extract_value_and_round(df, ["Chi phí tài chính", "Chi phí tiền lãi vay"], first_numeric_column, is_cost=True)
-        chi_phi_ban_hang = safe_extract_value_and_round(df, ["Chi phí bán hàng"], first_numeric_column, is_cost=True)
-        chi_phi_quan_ly = safe_extract_value_and_round(df, ["Chi phí quản lý doanh nghiệp", "Chi phí quản lý DN"], first_numeric_column, is_cost=True)
-        loi_nhuan = safe_extract_value_and_round(df, ["Lợi nhuận thuần từ hoạt động kinh doanh", "Lãi/Lỗ từ hoạt động kinh doanh", "LN trước thuế"], first_numeric_column)
-        loi_nhuan_khac = safe_extract_value_and_round(df, ["Lợi nhuận khác"], first_numeric_column)
-        thue_thu_nhap = safe_extract_value_and_round(df, ["Chi phí thuế TNDN hiện hành"], first_numeric_column, is_cost=True)
-        loi_nhuan_sau_thue = safe_extract_value_and_round(df, ["Lợi nhuận sau thuế thu nhập doanh nghiệp", "Lợi nhuận thuần", "Lợi nhuận sau thuế của Cổ đông công ty mẹ (đồng)"], first_numeric_column)
+        values = extract_values(statement, first_numeric_column, unit_factor)
+        doanh_thu_thuan = values["doanh_thu_thuan"]
+        gia_von_hang_ban = values["gia_von_hang_ban"]
+        loi_nhuan_gop = values["loi_nhuan_gop"]
+        doanh_thu_tai_chinh = values["doanh_thu_tai_chinh"]
+        chi_phi_tai_chinh = values["chi_phi_tai_chinh"]
+        chi_phi_ban_hang = values["chi_phi_ban_hang"]
+        chi_phi_quan_ly = values["chi_phi_quan_ly"]
+        loi_nhuan = values["loi_nhuan"]
+        loi_nhuan_khac = values["loi_nhuan_khac"]
+        thue_thu_nhap = values["thue_thu_nhap"]
+        loi_nhuan_sau_thue = values["loi_nhuan_sau_thue"]
 
         # Định nghĩa các luồng cho SankeyMATIC
         flows = [
@@ -110,15 +114,15 @@ def extract_flows_from_dataframe(df):
             ("Lợi nhuận trước thuế", loi_nhuan_sau_thue, "Lợi nhuận sau thuế")
         ]
 
-        # Tính ngưỡng là 0.1% của lợi nhuận sau thuế để bắt được nhiều chi tiết hơn
-        THRESHOLD_PERCENT = 0.001
-        threshold_value = loi_nhuan_sau_thue * THRESHOLD_PERCENT if loi_nhuan_sau_thue > 0 else 1
+        # Tính ngưỡng theo lợi nhuận sau thuế (mặc định 0.1%)
+        threshold_percent = THRESHOLD_PERCENT if threshold is None else threshold
+        threshold_value = loi_nhuan_sau_thue * threshold_percent if loi_nhuan_sau_thue > 0 else 1
 
         # Xuất dữ liệu
+        # Luồng nhỏ hơn ngưỡng được gộp vào nút "Khác (<nút>)" để tổng các nút cha không đổi
         output_lines = []
-        for source, value, target in flows:
-            if value >= threshold_value:
-                output_lines.append(f'{source} [{value}] {target}')
+        for source, value, target in fold_small_flows(flows, threshold_value):
+            output_lines.append(f'{source} [{value}] {target}')
         
         return '\n'.join(output_lines)
         
@@ -131,6 +135,7 @@ def extract_flows_from_excel(file_input):
     file_input: Đường dẫn file (str) hoặc file object (bytes).
     """
     try:
+        import pandas as pd
         df = pd.read_excel(file_input, skiprows=4)
         return extract_flows_from_dataframe(df)
     except Exception as e:
@@ -0,0 +1,186 @@
+"""
+Label matcher shared by the balance/income/cashflow extractors
+Compiles every synonym of a report into one Aho-Corasick automaton so all items
+are resolved against a statement's labels in a single scan
+"""
+
+import os
+import re
+import unicodedata
+from collections import deque
+
+from cache import LRUCache
+
+# Statement labels are shared tuples (see statement.py), so their keys are computed once per tuple
+LABEL_KEY_CACHE = LRUCache(maxsize=int(os.environ.get('LABEL_KEY_CACHE_SIZE', 256)))
+
+
+def normalize_text(text):
+    """
+    Chuẩn hóa text để so sánh: bỏ số thứ tự, bỏ khoảng trắng dư, viết thường
+    Ví dụ: 'I. Tiền và các khoản tương đương tiền' -> 'tiền và các khoản tương đương tiền'
+    """
+    if not isinstance(text, str):
+        return ""
+    # Bỏ các tiền tố như "I. ", "1. ", "A. ", "   - "
+    text = re.sub(r'^[A-Z0-9\.\s\-IXV]+[\.\s\-]+', '', text)
+    # Bỏ dấu ngoặc đơn và nội dung bên trong (thường là đơn vị hoặc chú thích)
+    text = re.sub(r'\s*\(.*\)', '', text)
+    # Bỏ khoảng trắng dư và chuyển về chữ thường
+    text = " ".join(text.split()).lower()
+    return text
+
+
+def fold_accents(text):
+    """Bỏ dấu tiếng Việt: 'tiền và tương đương' -> 'tien va tuong duong'"""
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFD', text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def label_key(text):
+    """Key used for matching: normalized first (the prefix rule needs original case), then accent-folded"""
+    return fold_accents(normalize_text(text))
+
+
+def label_keys(labels):
+    """label_key() of every label, cached per labels tuple"""
+    labels = tuple(labels)
+    keys = LABEL_KEY_CACHE.get(labels)
+    if keys is None:
+        keys = tuple(label_key(label) for label in labels)
+        LABEL_KEY_CACHE.set(labels, keys)
+    return keys
+
+
+class Automaton:
+    """
+    Minimal Aho-Corasick automaton over a list of string patterns
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pid, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(pid)
+
+        # Breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Return the set of pattern ids that occur anywhere in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class LabelMatcher:
+    """
+    Resolve report items (each a list of synonym labels) to row positions.
+
+    Rules per item, in order:
+    1. exact: first row whose key equals any synonym
+    2. contains: for each synonym in order, rows whose key contains it; the row
+       closest in length wins (len_diff), earliest row on ties
+    3. reverse (optional): for each synonym in order, first row whose key is
+       contained in the synonym (VCI labels with a "(đồng)" suffix etc.)
+    """
+
+    def __init__(self, items, reverse=False):
+        self.items = {name: [synonyms] if isinstance(synonyms, str) else list(synonyms)
+                      for name, synonyms in items.items()}
+        self.reverse = reverse
+
+        self._patterns = []
+        pattern_ids = {}
+        self._item_patterns = {}
+        for name, synonyms in self.items.items():
+            ids = []
+            for synonym in synonyms:
+                key = label_key(synonym)
+                if not key:
+                    continue
+                if key not in pattern_ids:
+                    pattern_ids[key] = len(self._patterns)
+                    self._patterns.append(key)
+                ids.append(pattern_ids[key])
+            self._item_patterns[name] = ids
+        self._automaton = Automaton(self._patterns)
+
+    def match(self, labels):
+        """
+        Args:
+            labels (iterable): statement labels in row order
+        Returns:
+            dict: item name -> row position, or None when nothing matched
+        """
+        keys = label_keys(labels)
+
+        # One scan: for each pattern, the rows containing it (exact hits are len_diff == 0)
+        exact = {}
+        best = {}
+        for row, key in enumerate(keys):
+            if not key:
+                continue
+            for pid in self._automaton.find(key):
+                len_diff = len(key) - len(self._patterns[pid])
+                if len_diff == 0:
+                    exact.setdefault(pid, row)
+                elif pid not in best or len_diff < best[pid][0]:
+                    best[pid] = (len_diff, row)
+
+        result = {}
+        unresolved = []
+        for name, pids in self._item_patterns.items():
+            rows = [exact[pid] for pid in pids if pid in exact]
+            if rows:
+                result[name] = min(rows)
+                continue
+            result[name] = next((best[pid][1] for pid in pids if pid in best), None)
+            if result[name] is None:
+                unresolved.append(name)
+
+        if self.reverse and unresolved:
+            self._match_reverse(keys, unresolved, result)
+        return result
+
+    def _match_reverse(self, keys, unresolved, result):
+        label_ids = {}
+        for row, key in enumerate(keys):
+            if key and key not in label_ids:
+                label_ids[key] = row
+        label_keys = list(label_ids)
+        automaton = Automaton(label_keys)
+        for name in unresolved:
+            for pid in self._item_patterns[name]:
+                found = automaton.find(self._patterns[pid])
+                if found:
+                    result[name] = min(label_ids[label_keys[i]] for i in found)
+                    break
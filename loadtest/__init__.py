@@ -0,0 +1,6 @@
+"""
+Load-test harness for the Flask app against a local stand-in for vnstock
+
+    python -m loadtest.run --concurrency 1 4 8 --duration 20 --save baseline
+    python -m loadtest.run --compare loadtest/results/baseline.json loadtest/results/after.json
+"""
@@ -0,0 +1,34 @@
+"""
+WSGI entry point: the real Flask app wired to the fake vnstock source
+
+    LOADTEST_LATENCY_MS=300 LOADTEST_ERROR_RATE=0.02 gunicorn loadtest.fake_app:app
+
+Configuration (environment):
+    LOADTEST_LATENCY_MS   mean upstream latency (default 300)
+    LOADTEST_JITTER_MS    standard deviation of the latency (default 50)
+    LOADTEST_ERROR_RATE   fraction of upstream calls that fail (default 0)
+    LOADTEST_SOURCE_LATENCY_MS  per-source mean latency, e.g. "KBS=2000,VCI=300"
+                                (use with SANKEY_SOURCES=KBS,VCI to exercise hedging)
+"""
+
+import os
+
+import data_fetcher
+from app import app
+from loadtest.fake_vnstock import client_factory
+
+source_latency = {}
+for part in filter(None, os.environ.get('LOADTEST_SOURCE_LATENCY_MS', '').split(',')):
+    name, _, ms = part.partition('=')
+    source_latency[name.strip().upper()] = float(ms) / 1000
+
+data_fetcher.set_client_factory(client_factory(
+    latency=float(os.environ.get('LOADTEST_LATENCY_MS', 300)) / 1000,
+    jitter=float(os.environ.get('LOADTEST_JITTER_MS', 50)) / 1000,
+    error_rate=float(os.environ.get('LOADTEST_ERROR_RATE', 0)),
+    source_latency=source_latency,
+))
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5050))
+    app.run(host='127.0.0.1', port=port, threaded=True)
@@ -0,0 +1,124 @@
+"""
+Local stand-in for vnstock's KBS and VCI sources
+Returns KBS-shaped frames (items as rows, periods as columns, values in thousand VND) or
+VCI-shaped frames (one row per period, values in VND) holding the same figures, after a
+configurable latency per source, and fails a configurable fraction of calls.
+"""
+
+import random
+import time
+import zlib
+
+import pandas as pd
+
+BALANCE_ITEMS = [
+    "TỔNG CỘNG TÀI SẢN", "A. TÀI SẢN NGẮN HẠN", "I. Tiền và các khoản tương đương tiền",
+    "II. Đầu tư tài chính ngắn hạn", "III. Các khoản phải thu ngắn hạn", "IV. Hàng tồn kho",
+    "V. Tài sản ngắn hạn khác", "B. TÀI SẢN DÀI HẠN", "I. Các khoản phải thu dài hạn",
+    "II. Tài sản cố định", "III. Bất động sản đầu tư", "IV. Tài sản dở dang dài hạn",
+    "V. Đầu tư tài chính dài hạn", "VI. Tài sản dài hạn khác", "C. NỢ PHẢI TRẢ", "I. Nợ ngắn hạn",
+    "1. Phải trả người bán ngắn hạn", "2. Người mua trả tiền trước ngắn hạn",
+    "3. Thuế và các khoản phải nộp Nhà nước", "4. Phải trả người lao động",
+    "5. Chi phí phải trả ngắn hạn", "9. Phải trả ngắn hạn khác",
+    "10. Vay và nợ thuê tài chính ngắn hạn", "12. Quỹ khen thưởng, phúc lợi", "II. Nợ dài hạn",
+    "8. Vay và nợ thuê tài chính dài hạn", "D. VỐN CHỦ SỞ HỮU", "1. Vốn góp của chủ sở hữu",
+    "2. Thặng dư vốn cổ phần", "5. Cổ phiếu quỹ", "8. Quỹ đầu tư phát triển",
+    "11. Lợi nhuận sau thuế chưa phân phối", "13. Lợi ích cổ đông không kiểm soát",
+    "TỔNG CỘNG NGUỒN VỐN",
+]
+
+INCOME_ITEMS = [
+    "1. Doanh thu bán hàng và cung cấp dịch vụ", "2. Các khoản giảm trừ doanh thu",
+    "3. Doanh thu thuần về bán hàng và cung cấp dịch vụ", "4. Giá vốn hàng bán",
+    "5. Lợi nhuận gộp về bán hàng và cung cấp dịch vụ", "6. Doanh thu hoạt động tài chính",
+    "7. Chi phí tài chính", "- Trong đó: Chi phí lãi vay", "9. Chi phí bán hàng",
+    "10. Chi phí quản lý doanh nghiệp", "11. Lợi nhuận thuần từ hoạt động kinh doanh",
+    "14. Lợi nhuận khác", "15. Tổng lợi nhuận kế toán trước thuế",
+    "16. Chi phí thuế TNDN hiện hành", "18. Lợi nhuận sau thuế thu nhập doanh nghiệp",
+]
+
+CASHFLOW_ITEMS = [
+    "1. Lợi nhuận trước thuế", "3. Lợi nhuận từ hoạt động kinh doanh trước thay đổi vốn lưu động",
+    "Lưu chuyển tiền thuần từ hoạt động kinh doanh",
+    "1. Tiền chi để mua sắm, xây dựng TSCĐ và các tài sản dài hạn khác",
+    "2. Tiền thu từ thanh lý, nhượng bán TSCĐ và các tài sản dài hạn khác",
+    "3. Tiền chi cho vay, mua các công cụ nợ của đơn vị khác",
+    "4. Tiền thu hồi cho vay, bán lại các công cụ nợ của đơn vị khác",
+    "7. Tiền thu lãi cho vay, cổ tức và lợi nhuận được chia",
+    "Lưu chuyển tiền thuần từ hoạt động đầu tư", "3. Tiền thu từ đi vay", "4. Tiền trả nợ gốc vay",
+    "6. Cổ tức, lợi nhuận đã trả cho chủ sở hữu", "Lưu chuyển tiền thuần từ hoạt động tài chính",
+    "Lưu chuyển tiền thuần trong kỳ", "Tiền và tương đương tiền đầu kỳ",
+    "Ảnh hưởng của thay đổi tỷ giá hối đoái quy đổi ngoại tệ", "Tiền và tương đương tiền cuối kỳ",
+]
+
+
+def _columns(period, latest_year):
+    if period == 'year':
+        return [str(y) for y in range(latest_year, latest_year - 5, -1)]
+    return [f"{y}-Q{q}" for y in range(latest_year, latest_year - 2, -1) for q in (4, 3, 2, 1)]
+
+
+def make_frame(symbol, items, period, latest_year=2025):
+    """Deterministic pseudo-statement for a symbol (same symbol -> same numbers)"""
+    rng = random.Random(zlib.crc32(f"{symbol}:{items[0]}:{period}".encode('utf-8')))
+    data = {'item': items}
+    for col in _columns(period, latest_year):
+        data[col] = [rng.choice((-1, 1, 1, 1)) * rng.randint(1_000_000, 50_000_000_000) for _ in items]
+    return pd.DataFrame(data)
+
+
+def make_vci_frame(symbol, items, period, latest_year=2025):
+    """make_frame() figures in VCI's layout: one row per period, 'Năm'/'Kỳ', values in VND"""
+    kbs = make_frame(symbol, items, period, latest_year)
+    rows = []
+    for col in kbs.columns[1:]:
+        year, _, quarter = col.partition('-Q')
+        row = {'CP': symbol, 'Năm': int(year), 'Kỳ': int(quarter or 5)}
+        row.update({item: value * 1000 for item, value in zip(items, kbs[col])})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class FakeFinance:
+    def __init__(self, symbol, source, latency, jitter, error_rate):
+        self.symbol = symbol
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def _respond(self, items, period):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"Fake {self.source} error for {self.symbol}")
+        if self.source == 'VCI':
+            return make_vci_frame(self.symbol, items, period)
+        return make_frame(self.symbol, items, period)
+
+    def balance_sheet(self, period='year', **kwargs):
+        return self._respond(BALANCE_ITEMS, period)
+
+    def income_statement(self, period='year', **kwargs):
+        return self._respond(INCOME_ITEMS, period)
+
+    def cash_flow(self, period='year', **kwargs):
+        return self._respond(CASHFLOW_ITEMS, period)
+
+
+class FakeStock:
+    def __init__(self, symbol, source, **options):
+        self.symbol = symbol
+        self.finance = FakeFinance(symbol, source, **options)
+
+
+def client_factory(latency=0.3, jitter=0.05, error_rate=0.0, source_latency=None):
+    """
+    Build a data_fetcher.set_client_factory() factory with the given behaviour (seconds).
+    source_latency optionally overrides the mean latency per source, e.g. {'VCI': 0.1}.
+    """
+    source_latency = source_latency or {}
+
+    def factory(symbol, source):
+        return FakeStock(symbol, source, latency=source_latency.get(source, latency),
+                         jitter=jitter, error_rate=error_rate)
+    return factory
@@ -0,0 +1,272 @@
+"""
+Drive mixed traffic against the app and report throughput and latency per endpoint
+
+The app is started as a subprocess (gunicorn by default, i.e. the Procfile serving model)
+using loadtest.fake_app, so no real vnstock calls are made. Use --url to target a server
+that is already running instead.
+
+Examples:
+    python -m loadtest.run --concurrency 1 4 8 16 --duration 20 --save baseline
+    python -m loadtest.run --server werkzeug --latency-ms 800 --error-rate 0.05
+    python -m loadtest.run --env STATEMENT_CACHE_SIZE=1 --env FLOW_CACHE_SIZE=1 --save no-cache
+    python -m loadtest.run --compare loadtest/results/baseline.json loadtest/results/no-cache.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from stats import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'loadtest', 'results')
+
+ENDPOINTS = ('sankey', 'all', 'stream', 'health')
+REPORT_TYPES = ('balance', 'income', 'cashflow')
+PERIODS = ('year', 'Q1', 'Q2', 'Q3', 'Q4')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in --mix: {name} (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_request(endpoint, base_url, symbols, rng):
+    """Return (url, body or None) for one randomly parameterized request"""
+    if endpoint == 'health':
+        return f"{base_url}/api/health", None
+    payload = {
+        'symbol': rng.choice(symbols),
+        'period': rng.choice(PERIODS),
+        'year': rng.choice((2024, 2025)),
+    }
+    if endpoint == 'sankey':
+        payload['report_type'] = rng.choice(REPORT_TYPES)
+        return f"{base_url}/api/generate-sankey", payload
+    if endpoint == 'stream':
+        return f"{base_url}/api/generate-all-reports/stream", payload
+    return f"{base_url}/api/generate-all-reports", payload
+
+
+def send(url, body, timeout):
+    """
+    POST (or GET without a body) and read the whole response, so the caller's timing covers
+    the full request. For the SSE endpoint that means reading the stream until the server
+    closes it; a stream that ends without its final "done" event counts as a failure (0).
+    """
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            content = resp.read()
+            if url.endswith('/stream') and resp.status == 200 and b'event: done' not in content:
+                return 0
+            return resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except Exception:
+        return 0  # connection error / timeout
+
+
+def run_level(base_url, concurrency, duration, mix, symbols, timeout, seed):
+    """Closed loop: `concurrency` workers each send requests back-to-back for `duration` seconds"""
+    samples = []  # (endpoint, latency, status)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    names, weights = zip(*mix.items())
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        local = []
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            url, body = build_request(endpoint, base_url, symbols, rng)
+            t0 = time.perf_counter()
+            status = send(url, body, timeout)
+            local.append((endpoint, time.perf_counter() - t0, status))
+        with lock:
+            samples.extend(local)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return summarize(samples, elapsed, concurrency)
+
+
+def summarize(samples, elapsed, concurrency):
+    def stats(rows):
+        latencies = [lat for _, lat, _ in rows]
+        errors = sum(1 for _, _, status in rows if status != 200)
+        return {
+            'count': len(rows),
+            'errors': errors,
+            'rps': round(len(rows) / elapsed, 2) if elapsed else 0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        }
+
+    endpoints = {}
+    for name in ENDPOINTS:
+        rows = [s for s in samples if s[0] == name]
+        if rows:
+            endpoints[name] = stats(rows)
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'endpoints': endpoints,
+        'total': stats(samples),
+    }
+
+
+def print_level(level):
+    print(f"\n--- concurrency {level['concurrency']} ({level['duration_s']}s) ---")
+    print(f"{'endpoint':<10}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in list(level['endpoints'].items()) + [('TOTAL', level['total'])]:
+        print(f"{name:<10}{s['count']:>8}{s['errors']:>6}{s['rps']:>9}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def compare(path_a, path_b):
+    with open(path_a, encoding='utf-8') as f:
+        a = json.load(f)
+    with open(path_b, encoding='utf-8') as f:
+        b = json.load(f)
+    print(f"A: {path_a} ({a['meta'].get('label')})\nB: {path_b} ({b['meta'].get('label')})")
+
+    def delta(x, y):
+        return f"{(y - x) / x * 100:+.0f}%" if x else 'n/a'
+
+    levels_b = {lvl['concurrency']: lvl for lvl in b['levels']}
+    for lvl_a in a['levels']:
+        lvl_b = levels_b.get(lvl_a['concurrency'])
+        if not lvl_b:
+            continue
+        print(f"\n--- concurrency {lvl_a['concurrency']} ---")
+        print(f"{'endpoint':<10}{'rps A':>9}{'rps B':>9}{'Δ':>7}{'p95 A':>9}{'p95 B':>9}{'Δ':>7}{'p99 A':>9}{'p99 B':>9}{'Δ':>7}")
+        rows_a = dict(lvl_a['endpoints'], TOTAL=lvl_a['total'])
+        rows_b = dict(lvl_b['endpoints'], TOTAL=lvl_b['total'])
+        for name, sa in rows_a.items():
+            sb = rows_b.get(name)
+            if not sb:
+                continue
+            print(f"{name:<10}{sa['rps']:>9}{sb['rps']:>9}{delta(sa['rps'], sb['rps']):>7}"
+                  f"{sa['p95_ms']:>9}{sb['p95_ms']:>9}{delta(sa['p95_ms'], sb['p95_ms']):>7}"
+                  f"{sa['p99_ms']:>9}{sb['p99_ms']:>9}{delta(sa['p99_ms'], sb['p99_ms']):>7}")
+
+
+def start_server(args):
+    env = dict(os.environ)
+    env.update({
+        'LOADTEST_LATENCY_MS': str(args.latency_ms),
+        'LOADTEST_JITTER_MS': str(args.jitter_ms),
+        'LOADTEST_ERROR_RATE': str(args.error_rate),
+        'PORT': str(args.port),
+        'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')])),
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    if args.server == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{args.port}",
+               '--workers', str(args.gunicorn_workers), *args.gunicorn_args.split(), 'loadtest.fake_app:app']
+    else:
+        cmd = [sys.executable, '-m', 'loadtest.fake_app']
+    print(f"🚀 Starting: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL if not args.server_log else None,
+                            stderr=subprocess.DEVNULL if not args.server_log else None)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode} (rerun with --server-log)")
+        if send(f"{base_url}/api/health", None, timeout=1) == 200:
+            return proc, base_url
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('Server did not become healthy within 20s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the Sankey API against a fake vnstock source')
+    parser.add_argument('--compare', nargs=2, metavar=('A', 'B'), help='Compare two saved runs and exit')
+    parser.add_argument('--url', help='Use an already running server instead of starting one')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--gunicorn-workers', type=int, default=1, help='Default 1 = one dyno running the Procfile command')
+    parser.add_argument('--gunicorn-args', default='', help="Extra gunicorn flags, e.g. '--threads 8'")
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--server-log', action='store_true', help='Show server output')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='Extra server environment')
+    parser.add_argument('--latency-ms', type=float, default=300, help='Mean fake upstream latency')
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of failing upstream calls')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--mix', default='sankey=6,all=2,stream=1,health=1', help='Endpoint weights')
+    parser.add_argument('--symbols', type=int, default=30, help='Number of distinct fake tickers (cache spread)')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='LABEL', help=f"Save results to {os.path.relpath(RESULTS_DIR, ROOT)}/LABEL.json")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    symbols = [f"T{i:03d}" for i in range(args.symbols)]
+
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        proc, base_url = start_server(args)
+
+    levels = []
+    try:
+        for concurrency in args.concurrency:
+            level = run_level(base_url, concurrency, args.duration, mix, symbols, args.timeout, args.seed)
+            levels.append(level)
+            print_level(level)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        meta = {key: value for key, value in vars(args).items() if key not in ('compare', 'save')}
+        meta.update({'label': args.save, 'timestamp': datetime.now().isoformat(timespec='seconds')})
+        path = os.path.join(RESULTS_DIR, f"{args.save}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'levels': levels}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Saved {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+On-demand per-request profiling for the /api/* routes
+
+Disabled unless PROFILE_TOKEN is set. A request is profiled when it carries
+    X-Profile: sample | cprofile     (or ?profile=sample / ?profile=cprofile)
+    X-Profile-Token: <PROFILE_TOKEN>
+
+Output goes to PROFILE_DIR (default ./profiles), tagged with symbol/report/period:
+    sample   -> .folded  collapsed stacks (flamegraph.pl, speedscope, inferno)
+    cprofile -> .prof    pstats dump (snakeviz, flameprof, gprof2dot)
+"""
+
+import cProfile
+import functools
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import request
+
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 2)) / 1000
+
+MODES = ('sample', 'cprofile')
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of a set of threads at a fixed interval from a background
+    thread and counts collapsed stacks ("outer;...;inner count"). Threads can be added and
+    removed while sampling (see StreamProfile).
+    """
+
+    def __init__(self, *thread_ids, interval=SAMPLE_INTERVAL):
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def add(self, thread_id):
+        with self._lock:
+            self.thread_ids.add(thread_id)
+
+    def discard(self, thread_id):
+        with self._lock:
+            self.thread_ids.discard(thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = tuple(self.thread_ids)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if names:
+                    self.stacks[";".join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def requested_mode():
+    """Return the profiling mode for the current request, or None (the common, cheap path)"""
+    if not PROFILE_TOKEN:
+        return None
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', ''), PROFILE_TOKEN):
+        return None
+    mode = mode.strip().lower()
+    if mode in ('1', 'true', 'yes'):
+        mode = 'sample'
+    return mode if mode in MODES else None
+
+
+def _profile_name(mode):
+    data = request.get_json(silent=True) or {}
+    tags = [
+        data.get('symbol') or 'na',
+        data.get('report_type') or request.path.rstrip('/').rsplit('/', 1)[-1],
+        data.get('period') or 'na',
+        str(data.get('year') or 'na'),
+    ]
+    tag = "_".join(re.sub(r'[^A-Za-z0-9-]+', '-', str(t)).strip('-') for t in tags)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return f"{stamp}_{tag}_{mode}"
+
+
+def profiled(view):
+    """Decorator for Flask views: run under the requested profiler, otherwise call straight through"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_mode()
+        if mode is None:
+            return view(*args, **kwargs)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = _profile_name(mode)
+        started = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(view, *args, **kwargs)
+            filename = name + '.prof'
+            profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        else:
+            with StackSampler(threading.get_ident()) as sampler:
+                response = view(*args, **kwargs)
+            filename = name + '.folded'
+            sampler.write(os.path.join(PROFILE_DIR, filename))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"🔬 Profiled {request.path} in {elapsed_ms:.0f} ms -> {filename}")
+
+        # Views return either a Response or a (Response, status) tuple
+        resp = response[0] if isinstance(response, tuple) else response
+        if hasattr(resp, 'headers'):
+            resp.headers['X-Profile-File'] = filename
+        return response
+    return wrapper
+
+
+class StreamProfile:
+    """
+    Profiling for streamed responses. Their work runs in the response generator and its
+    worker threads after the view has returned, where profiled() no longer sees it:
+
+        profile = stream_profile()
+        body = profile.run(generate()) if profile else generate()
+
+    sample:   one sampler over the generator thread and every thread running a wrap()ped task
+    cprofile: cProfile follows a single thread, so the view should run its tasks serially
+              in the generator when profile.parallel is False
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.parallel = mode == 'sample'
+        self.filename = _profile_name(mode) + ('.prof' if mode == 'cprofile' else '.folded')
+        self.path = request.path
+        self._sampler = None
+
+    def wrap(self, fn):
+        """fn for a worker thread: the thread is sampled while fn runs"""
+        @functools.wraps(fn)
+        def task(*args, **kwargs):
+            sampler = self._sampler
+            if sampler is None:
+                return fn(*args, **kwargs)
+            thread_id = threading.get_ident()
+            sampler.add(thread_id)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sampler.discard(thread_id)
+        return task
+
+    def run(self, body):
+        """Wrap the response generator; the profile is written once it is exhausted or closed"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.filename)
+        started = time.perf_counter()
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            body = iter(body)
+            try:
+                while True:
+                    # Only while producing an item, not while the server writes it out
+                    profiler.enable()
+                    try:
+                        item = next(body)
+                    except StopIteration:
+                        break
+                    finally:
+                        profiler.disable()
+                    yield item
+            finally:
+                profiler.dump_stats(path)
+        else:
+            self._sampler = StackSampler(threading.get_ident())
+            try:
+                with self._sampler:
+                    yield from body
+            finally:
+                self._sampler.write(path)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"🔬 Profiled {self.path} in {elapsed_ms:.0f} ms -> {self.filename}")
+
+
+def stream_profile():
+    """StreamProfile for the current request, or None when it is not profiled"""
+    mode = requested_mode()
+    return StreamProfile(mode) if mode else None
@@ -0,0 +1,81 @@
+"""
+vnstock data sources and their normalization
+
+Every source returns statements in its own shape and unit. normalize() turns each into the
+same Statement (items as rows, periods as columns like '2024' / '2024-Q3', latest first,
+values in VND) so the extractors, caches and derived periods never see the difference.
+
+    KBS  long format: 'item' column + one column per period, thousand VND
+    VCI  wide format: one row per period ('Năm', 'Kỳ'), one column per item, VND
+"""
+
+from statement import Statement, META_COLUMNS
+
+# Statement method per report type (same names on every source)
+REPORT_METHODS = {
+    'balance': 'balance_sheet',
+    'income': 'income_statement',
+    'cashflow': 'cash_flow',
+}
+
+# Extra keyword arguments per source
+SOURCE_OPTIONS = {
+    'KBS': {},
+    'VCI': {'lang': 'vi'},
+}
+
+VCI_META_COLUMNS = ('ticker', 'CP', 'Năm', 'Kỳ', 'yearReport', 'lengthReport')
+
+
+def fetch_frame(stock, source, report_type, period_type):
+    """Call the source's statement method on a vnstock stock client and return the raw frame"""
+    method = getattr(stock.finance, REPORT_METHODS[report_type])
+    return method(period=period_type, **SOURCE_OPTIONS.get(source, {}))
+
+
+def normalize_kbs(df, period_type):
+    # KBS returns data in THOUSAND VND, so we multiply by 1000 to get VND
+    # this ensures compatibility with the extraction modules which expect VND
+    return Statement.from_dataframe(df, label_column='item', scale=1000)
+
+
+def normalize_vci(df, period_type):
+    """Transpose VCI's one-row-per-period frame; quarters come from 'Kỳ' (1-4)"""
+    columns = list(df.columns)
+    if getattr(df.columns, 'nlevels', 1) > 1:
+        # Newer VCI frames group items under a header level; the item name is the last level
+        columns = [c[-1] for c in columns]
+
+    year_col = next(i for i, c in enumerate(columns) if c in ('Năm', 'yearReport'))
+    quarter_col = next((i for i, c in enumerate(columns) if c in ('Kỳ', 'lengthReport')), None)
+    item_cols = [i for i, c in enumerate(columns) if c not in VCI_META_COLUMNS and c not in META_COLUMNS]
+
+    rows = []
+    for values in df.itertuples(index=False, name=None):
+        year = int(values[year_col])
+        quarter = int(values[quarter_col]) if quarter_col is not None else 0
+        if period_type == 'year' or quarter not in (1, 2, 3, 4):
+            period, order = str(year), (year, 5)
+        else:
+            period, order = f"{year}-Q{quarter}", (year, quarter)
+        rows.append((order, period, [values[i] for i in item_cols]))
+    rows.sort(key=lambda row: row[0], reverse=True)  # latest first, like KBS
+
+    return Statement.from_rows(
+        [columns[i] for i in item_cols],
+        [period for _, period, _ in rows],
+        [values for _, _, values in rows],
+    )
+
+
+NORMALIZERS = {
+    'KBS': normalize_kbs,
+    'VCI': normalize_vci,
+}
+
+
+def normalize(source, df, period_type):
+    """Raw frame from `source` -> Statement, or None when the source returned nothing"""
+    if df is None or df.empty:
+        return None
+    return NORMALIZERS[source](df, period_type)
@@ -0,0 +1,101 @@
+"""
+Compact, pandas-free financial statement used on the extraction path
+
+A Statement holds the row labels once, as a tuple of interned strings (the same labels
+are shared by every ticker's statement), and one contiguous array('d') per period.
+data_fetcher converts each upstream frame once and caches the Statement; the extractors
+and the flow cache read it directly instead of copying and renaming DataFrames per request.
+"""
+
+import math
+import sys
+from array import array
+
+# Non-period columns KBS may return next to 'item'
+META_COLUMNS = ('ticker', 'item', 'item_id', 'Năm', 'Kỳ')
+
+
+def _to_float(value):
+    """Coerce a cell to float; accounting strings like '(1,234)' become -1234, blanks NaN"""
+    if isinstance(value, str):
+        value = value.replace(',', '').replace('(', '-').replace(')', '').strip()
+        if value in ('-', ''):
+            return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class Statement:
+    """
+    Rows x periods table of floats with labelled rows. Missing values are NaN.
+
+    Attributes:
+        labels (tuple): stripped, interned row labels
+        periods (tuple): period names (e.g. '2024', '2024-Q3'), in source order
+        columns (tuple): one array('d') per period, aligned with labels
+    """
+
+    __slots__ = ('labels', 'periods', 'columns')
+
+    def __init__(self, labels, periods, columns):
+        self.labels = labels
+        self.periods = tuple(periods)
+        self.columns = tuple(columns)
+
+    @classmethod
+    def from_rows(cls, labels, periods, columns, scale=1):
+        """Build from plain sequences; values are coerced to float and multiplied by scale"""
+        labels = tuple(sys.intern(str(label).strip()) for label in labels)
+        arrays = []
+        for values in columns:
+            arrays.append(array('d', (_to_float(v) * scale for v in values)))
+        return cls(labels, periods, arrays)
+
+    @classmethod
+    def from_dataframe(cls, df, label_column=None, scale=1):
+        """
+        Convert a DataFrame (pandas is not imported here).
+
+        Without label_column the first column holds the labels and every other column is a
+        period, which is the layout of the Excel exports and of the old extractor input.
+        With label_column (e.g. 'item' for KBS), META_COLUMNS are skipped as well.
+        """
+        if label_column is None:
+            label_column = df.columns[0]
+            value_columns = list(df.columns[1:])
+        else:
+            value_columns = [c for c in df.columns if c != label_column and c not in META_COLUMNS]
+        return cls.from_rows(
+            df[label_column].tolist(),
+            [str(c) for c in value_columns],
+            [df[c].tolist() for c in value_columns],
+            scale,
+        )
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return f"Statement({len(self.labels)} rows x {len(self.periods)} periods: {', '.join(self.periods)})"
+
+    def column(self, period):
+        """Values of one period (the array itself, not a copy)"""
+        return self.columns[self.periods.index(period)]
+
+    def select(self, period):
+        """Single-period Statement sharing this one's labels and array"""
+        return Statement(self.labels, (period,), (self.column(period),))
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the values and the container itself"""
+        return sys.getsizeof(self.labels) + sum(sys.getsizeof(c) for c in self.columns)
+
+
+def as_statement(data):
+    """Accept a Statement or a DataFrame laid out as label column + value columns"""
+    if isinstance(data, Statement):
+        return data
+    return Statement.from_dataframe(data)
@@ -9,11 +9,14 @@ document.addEventListener('DOMContentLoaded', function () {
     const sankeyRawText = document.getElementById('sankeyRawText');
     const sankeyRawTextContainer = document.getElementById('sankeyRawTextContainer');
     const downloadBtn = document.getElementById('downloadBtn');
+    const downloadZipBtn = document.getElementById('downloadZipBtn');
     const submitAllBtn = document.getElementById('submitAllBtn');
 
     // --- Helpers ---
     const formatActualP = (p) => {
         if (!p) return '';
+        // Trailing twelve months, e.g. "TTM 2024-Q3"
+        if (p.startsWith('TTM ')) return `12 tháng đến hết ${formatActualP(p.slice(4))}`;
         if (p.includes('-Q')) {
             const [y, q] = p.split('-Q');
             const qNames = { 'Q1': 'I', 'Q2': 'II', 'Q3': 'III', 'Q4': 'IV' };
@@ -47,6 +50,8 @@ document.addEventListener('DOMContentLoaded', function () {
         flowOpacity: 0.45,
         flowCurvature: 0.5,
         layoutIterations: 25,
+        // PNG export resolution multiplier
+        pngScale: 2,
         palette: ["#3b82f6", "#10b981", "#f59e0b", "#8b5cf6", "#ef4444", "#06b6d4", "#ec4899", "#84cc16", "#f43f5e", "#94a3b8"]
     };
 
@@ -196,11 +201,142 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     // --- PNG Export Handler ---
-    document.getElementById('downloadPngBtn')?.addEventListener('click', () => {
+    // Header button: single report -> one PNG; three-report view -> one combined PNG
+    document.getElementById('downloadPngBtn')?.addEventListener('click', async (e) => {
+        if (lastFormData && !lastFormData.report_type) {
+            await exportAllCharts('combined', e.currentTarget);
+            return;
+        }
         const svgElement = document.querySelector('#sankeyDiagram svg');
-        if (svgElement) exportSvgToPng(svgElement, lastFormData);
+        if (svgElement) exportPng(svgElement, lastFormData);
     });
 
+    downloadZipBtn?.addEventListener('click', async (e) => {
+        await exportAllCharts('zip', e.currentTarget);
+    });
+
+    const pngFileName = (formData, reportCode) =>
+        `sankey_${formData.symbol}_${reportCode || formData.report_type || 'all'}_${formData.period}_${formData.year}`;
+
+    const downloadBlob = (blob, filename) => {
+        const url = URL.createObjectURL(blob);
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = filename;
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        setTimeout(() => URL.revokeObjectURL(url), 1000);
+    };
+
+    // --- Off-main-thread export (png_worker.js) ---
+    // The page only decodes the SVG into an ImageBitmap; drawing, PNG encoding,
+    // combining and zipping run in the worker on an OffscreenCanvas.
+    const canExportInWorker = typeof Worker !== 'undefined'
+        && typeof OffscreenCanvas !== 'undefined'
+        && 'convertToBlob' in OffscreenCanvas.prototype
+        && typeof createImageBitmap !== 'undefined';
+
+    let pngWorker = null;
+    let pngJobId = 0;
+    const pngJobs = new Map();
+
+    function runPngJob(mode, images) {
+        if (!pngWorker) {
+            pngWorker = new Worker('/static/js/png_worker.js');
+            pngWorker.onmessage = (e) => {
+                const job = pngJobs.get(e.data.id);
+                if (!job) return;
+                pngJobs.delete(e.data.id);
+                if (e.data.error) job.reject(new Error(e.data.error));
+                else job.resolve(e.data.blob);
+            };
+            pngWorker.onerror = (e) => {
+                pngJobs.forEach(job => job.reject(new Error(e.message || 'PNG worker failed')));
+                pngJobs.clear();
+                pngWorker.terminate();
+                pngWorker = null;
+            };
+        }
+        const id = ++pngJobId;
+        return new Promise((resolve, reject) => {
+            pngJobs.set(id, { resolve, reject });
+            pngWorker.postMessage(
+                { id, mode, images, gap: 40 * sankeySettings.pngScale },
+                images.map(img => img.bitmap)
+            );
+        });
+    }
+
+    // Decode an SVG at `scale` into an ImageBitmap (vector-scaled via viewBox, so text stays sharp)
+    async function svgToBitmap(svgElement, scale) {
+        const width = parseInt(svgElement.getAttribute('width'));
+        const height = parseInt(svgElement.getAttribute('height'));
+
+        const cloneSvg = svgElement.cloneNode(true);
+        cloneSvg.setAttribute('viewBox', `0 0 ${width} ${height}`);
+        cloneSvg.setAttribute('width', width * scale);
+        cloneSvg.setAttribute('height', height * scale);
+
+        const svgData = new XMLSerializer().serializeToString(cloneSvg);
+        const url = URL.createObjectURL(new Blob([svgData], { type: 'image/svg+xml;charset=utf-8' }));
+        try {
+            const img = new Image();
+            img.src = url;
+            await img.decode();
+            return await createImageBitmap(img);
+        } finally {
+            URL.revokeObjectURL(url);
+        }
+    }
+
+    // Export one diagram, falling back to the main-thread canvas if workers can't do it
+    async function exportPng(svgElement, formData) {
+        if (!canExportInWorker) {
+            exportSvgToPng(svgElement, formData);
+            return;
+        }
+        try {
+            const bitmap = await svgToBitmap(svgElement, sankeySettings.pngScale);
+            const blob = await runPngJob('png', [{ name: 'diagram.png', bitmap }]);
+            downloadBlob(blob, `${pngFileName(formData)}.png`);
+        } catch (error) {
+            console.error('Worker PNG export failed, using main thread:', error);
+            exportSvgToPng(svgElement, formData);
+        }
+    }
+
+    // Export every chart of the three-report view as one combined PNG or one zip
+    async function exportAllCharts(mode, button) {
+        const charts = [...sankeyDiagram.querySelectorAll('.chart-wrapper')]
+            .map(wrapper => ({ type: wrapper.id.replace('chart-', ''), svg: wrapper.querySelector('.sankey-item-diagram svg') }))
+            .filter(chart => chart.svg);
+        if (!charts.length || !lastFormData) return;
+
+        if (!canExportInWorker) {
+            charts.forEach(chart => exportSvgToPng(chart.svg, { ...lastFormData, report_type: chart.type }));
+            return;
+        }
+
+        if (button) button.disabled = true;
+        try {
+            const images = [];
+            for (const chart of charts) {
+                images.push({
+                    name: `${pngFileName(lastFormData, chart.type)}.png`,
+                    bitmap: await svgToBitmap(chart.svg, sankeySettings.pngScale)
+                });
+            }
+            const blob = await runPngJob(mode, images);
+            downloadBlob(blob, `${pngFileName(lastFormData)}.${mode === 'zip' ? 'zip' : 'png'}`);
+        } catch (error) {
+            console.error('Batch PNG export failed:', error);
+            charts.forEach(chart => exportSvgToPng(chart.svg, { ...lastFormData, report_type: chart.type }));
+        } finally {
+            if (button) button.disabled = false;
+        }
+    }
+
     function exportSvgToPng(svgElement, formData) {
         // Clone the SVG to avoid modifying the visible one during export
         const cloneSvg = svgElement.cloneNode(true);
@@ -291,7 +427,7 @@ document.addEventListener('DOMContentLoaded', function () {
             }
 
             const reportNames = { 'balance': 'Bảng Cân Đối Kế Toán', 'income': 'Báo Cáo Kết Quả Kinh Doanh', 'cashflow': 'Báo Cáo Lưu Chuyển Tiền Tệ' };
-            const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm' };
+            const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm', 'TTM': '12 tháng gần nhất' };
 
             const displayPeriod = data.actual_period ? formatActualP(data.actual_period) : `${periodNames[formData.period]} ${formData.year}`;
 
@@ -305,6 +441,7 @@ document.addEventListener('DOMContentLoaded', function () {
             lastFormData = { ...formData, actual_period_text: displayPeriod };
             sankeyRawText.textContent = data.data;
             sankeyRawTextContainer.style.display = 'block';
+            downloadZipBtn.style.display = 'none';
             resultContainer.style.display = 'block';
 
             // Hide initial state message
@@ -346,22 +483,170 @@ document.addEventListener('DOMContentLoaded', function () {
         resultContainer.style.display = 'none';
 
         try {
-            const response = await fetch('/api/generate-all-reports', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(formData)
+            // Precomputed bundle (build_snapshots.py) if one exists for this request
+            const snapshot = await loadSnapshot(formData);
+
+            // Otherwise the streaming endpoint: each report arrives as soon as it is ready
+            let response = null;
+            if (!snapshot) {
+                response = await fetch('/api/generate-all-reports/stream', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(formData)
+                });
+
+                if (!response.ok || !response.body) {
+                    const data = await response.json().catch(() => ({}));
+                    throw new Error(data.error || 'Có lỗi xảy ra khi tạo báo cáo');
+                }
+            }
+
+            // Prepare UI for multiple charts
+            const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm', 'TTM': '12 tháng gần nhất' };
+
+            resultTitle.innerHTML = `
+                <div class="result-title-main">Báo Cáo Tài Chính Tổng Hợp</div>
+                <div class="result-title-sub">${formData.symbol} | ${periodNames[formData.period]} ${formData.year} | Đơn vị: Tỷ VNĐ</div>
+            `;
+
+            sankeyDiagram.innerHTML = '<div class="multi-charts-container"></div>';
+            const multiContainer = sankeyDiagram.querySelector('.multi-charts-container');
+
+            const reportNames = {
+                'balance': 'Bảng Cân Đối Kế Toán',
+                'income': 'Kết Quả Kinh Doanh',
+                'cashflow': 'Lưu Chuyển Tiền Tệ'
+            };
+            const reportOrder = ['balance', 'income', 'cashflow'];
+
+            // Placeholders in fixed order so charts don't jump around as reports arrive
+            const wrappers = {};
+            reportOrder.forEach(type => {
+                const wrapper = document.createElement('div');
+                wrapper.className = 'chart-wrapper';
+                wrapper.id = `chart-${type}`;
+                wrapper.innerHTML = `
+                    <div class="chart-title-container"><span class="chart-type-tag">${reportNames[type]}</span></div>
+                    <div class="chart-loading"><div class="spinner"></div>Đang tải...</div>
+                `;
+                multiContainer.appendChild(wrapper);
+                wrappers[type] = wrapper;
             });
 
-            const data = await response.json();
+            lastFormData = formData;
+            downloadZipBtn.style.display = '';
+            sankeyRawTextContainer.style.display = 'none'; // Hide raw text for multi-view
+            resultContainer.style.display = 'block';
 
-            if (!response.ok || !data.success) {
-                throw new Error(data.error || 'Có lỗi xảy ra khi tạo báo cáo');
+            const initialState = document.getElementById('initialState');
+            if (initialState) initialState.style.display = 'none';
+
+            // Render one chart into its placeholder
+            const renderReport = (type, text, actualP) => {
+                const wrapper = wrappers[type];
+                if (!wrapper) return;
+                if (!text || text.startsWith('// Error')) {
+                    wrapper.remove();
+                    return;
+                }
+                wrapper.innerHTML = '';
+
+                actualP = actualP || '';
+                const isMismatch = actualP && !actualP.includes(formData.year.toString());
+
+                const titleDiv = document.createElement('div');
+                titleDiv.className = 'chart-title-container';
+                titleDiv.style.display = 'flex';
+                titleDiv.style.justifyContent = 'space-between';
+                titleDiv.style.alignItems = 'center';
+
+                const tagWrapper = document.createElement('div');
+                tagWrapper.style.display = 'flex';
+                tagWrapper.style.alignItems = 'center';
+                tagWrapper.style.gap = '8px';
+
+                const tag = document.createElement('span');
+                tag.className = 'chart-type-tag';
+                tag.textContent = reportNames[type];
+                tagWrapper.appendChild(tag);
+
+                if (isMismatch) {
+                    const warnTag = document.createElement('span');
+                    warnTag.style.fontSize = '0.75rem';
+                    warnTag.style.color = '#f59e0b';
+                    warnTag.style.fontWeight = '600';
+                    warnTag.textContent = `(Dữ liệu: ${formatActualP(actualP)})`;
+                    tagWrapper.appendChild(warnTag);
+                }
+                titleDiv.appendChild(tagWrapper);
+
+                const dlBtn = document.createElement('button');
+                dlBtn.className = 'btn-download';
+                dlBtn.style.padding = '0.3rem 0.6rem';
+                dlBtn.style.fontSize = '0.75rem';
+                dlBtn.innerHTML = `
+                    <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2"
+                            d="M4 16l4.586-4.586a2 2 0 012.828 0L16 16m-2-2l1.586-1.586a2 2 0 012.828 0L20 14m-6-6h.01M6 20h12a2 2 0 002-2V6a2 2 0 00-2-2H6a2 2 0 00-2 2v12a2 2 0 002 2z">
+                        </path>
+                    </svg>
+                    Lưu PNG
+                `;
+                titleDiv.appendChild(dlBtn);
+
+                wrapper.appendChild(titleDiv);
+
+                const chartDiv = document.createElement('div');
+                chartDiv.className = 'sankey-item-diagram';
+                chartDiv.style.overflowX = 'auto'; // Support scroll for horizontal ratio
+                wrapper.appendChild(chartDiv);
+
+                // We need a specific formData for each render to get the title right in SVG
+                const specificFormData = {
+                    ...formData,
+                    report_type: type,
+                    actual_period_text: isMismatch ? formatActualP(actualP) : `${periodNames[formData.period]} ${formData.year}`
+                };
+                renderSankeyDiagram(text, specificFormData, chartDiv);
+
+                // Add click listener for this specific download button
+                dlBtn.addEventListener('click', () => {
+                    const svg = chartDiv.querySelector('svg');
+                    if (svg) exportPng(svg, specificFormData);
+                });
+            };
+
+            const results = {};
+            let summary = null;
+            const onEvent = (event, payload) => {
+                if (event === 'report') {
+                    results[payload.report_type] = payload.data;
+                    renderReport(payload.report_type, payload.data, payload.actual_period);
+                } else if (event === 'done') {
+                    summary = payload;
+                }
+            };
+
+            if (snapshot) {
+                // Replay the bundle as the same events the stream would send
+                reportOrder.forEach(type => {
+                    if (type in snapshot.data) {
+                        onEvent('report', { report_type: type, data: snapshot.data[type], actual_period: snapshot.actual_periods[type] });
+                    }
+                });
+                onEvent('done', snapshot);
+            } else {
+                await readEventStream(response, onEvent);
+            }
+
+            if (!summary) {
+                throw new Error('Mất kết nối khi đang tải báo cáo');
             }
 
             // Batch Year Mismatch Warning
             const mismatched = [];
-            if (data.actual_periods) {
-                for (const [key, ap] of Object.entries(data.actual_periods)) {
+            if (summary.actual_periods) {
+                for (const [key, ap] of Object.entries(summary.actual_periods)) {
                     if (ap && !ap.includes(formData.year.toString())) {
                         mismatched.push(ap);
                     }
@@ -382,111 +667,15 @@ document.addEventListener('DOMContentLoaded', function () {
                 errorMessage.style.color = '';
             }
 
-            // Prepare UI for multiple charts
-            const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm' };
-
-            resultTitle.innerHTML = `
-                <div class="result-title-main">Báo Cáo Tài Chính Tổng Hợp</div>
-                <div class="result-title-sub">${formData.symbol} | ${periodNames[formData.period]} ${formData.year} | Đơn vị: Tỷ VNĐ</div>
-            `;
-
-            addRotateButton();
-
-            sankeyDiagram.innerHTML = '<div class="multi-charts-container"></div>';
-            const multiContainer = sankeyDiagram.querySelector('.multi-charts-container');
-
-            const reportNames = {
-                'balance': 'Bảng Cân Đối Kế Toán',
-                'income': 'Kết Quả Kinh Doanh',
-                'cashflow': 'Lưu Chuyển Tiền Tệ'
-            };
-
-            // Render each chart
-            ['balance', 'income', 'cashflow'].forEach(type => {
-                if (data.data[type] && !data.data[type].startsWith('// Error')) {
-                    const wrapper = document.createElement('div');
-                    wrapper.className = 'chart-wrapper';
-                    wrapper.id = `chart-${type}`;
-
-                    const actualP = data.actual_periods?.[type] || '';
-                    const isMismatch = actualP && !actualP.includes(formData.year.toString());
-
-                    const titleDiv = document.createElement('div');
-                    titleDiv.className = 'chart-title-container';
-                    titleDiv.style.display = 'flex';
-                    titleDiv.style.justifyContent = 'space-between';
-                    titleDiv.style.alignItems = 'center';
-
-                    const tagWrapper = document.createElement('div');
-                    tagWrapper.style.display = 'flex';
-                    tagWrapper.style.alignItems = 'center';
-                    tagWrapper.style.gap = '8px';
-
-                    const tag = document.createElement('span');
-                    tag.className = 'chart-type-tag';
-                    tag.textContent = reportNames[type];
-                    tagWrapper.appendChild(tag);
-
-                    if (isMismatch) {
-                        const warnTag = document.createElement('span');
-                        warnTag.style.fontSize = '0.75rem';
-                        warnTag.style.color = '#f59e0b';
-                        warnTag.style.fontWeight = '600';
-                        warnTag.textContent = `(Dữ liệu: ${formatActualP(actualP)})`;
-                        tagWrapper.appendChild(warnTag);
-                    }
-                    titleDiv.appendChild(tagWrapper);
-
-                    const dlBtn = document.createElement('button');
-                    dlBtn.className = 'btn-download';
-                    dlBtn.style.padding = '0.3rem 0.6rem';
-                    dlBtn.style.fontSize = '0.75rem';
-                    dlBtn.innerHTML = `
-                        <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2"
-                                d="M4 16l4.586-4.586a2 2 0 012.828 0L16 16m-2-2l1.586-1.586a2 2 0 012.828 0L20 14m-6-6h.01M6 20h12a2 2 0 002-2V6a2 2 0 00-2-2H6a2 2 0 00-2 2v12a2 2 0 002 2z">
-                            </path>
-                        </svg>
-                        Lưu PNG
-                    `;
-                    titleDiv.appendChild(dlBtn);
-
-                    wrapper.appendChild(titleDiv);
-
-                    const chartDiv = document.createElement('div');
-                    chartDiv.className = 'sankey-item-diagram';
-                    chartDiv.style.overflowX = 'auto'; // Support scroll for horizontal ratio
-                    wrapper.appendChild(chartDiv);
-
-                    multiContainer.appendChild(wrapper);
-
-                    // We need a specific formData for each render to get the title right in SVG
-                    const specificFormData = {
-                        ...formData,
-                        report_type: type,
-                        actual_period_text: isMismatch ? formatActualP(actualP) : `${periodNames[formData.period]} ${formData.year}`
-                    };
-                    renderSankeyDiagram(data.data[type], specificFormData, chartDiv);
-
-                    // Add click listener for this specific download button
-                    dlBtn.addEventListener('click', () => {
-                        const svg = chartDiv.querySelector('svg');
-                        if (svg) exportSvgToPng(svg, specificFormData);
-                    });
-                }
-            });
-
-            lastSankeyText = JSON.stringify(data.data, null, 2);
-            lastFormData = formData;
+            const ordered = {};
+            reportOrder.forEach(type => { if (type in results) ordered[type] = results[type]; });
+            lastSankeyText = JSON.stringify(ordered, null, 2);
             sankeyRawText.textContent = lastSankeyText;
-            sankeyRawTextContainer.style.display = 'none'; // Hide raw text for multi-view
-            resultContainer.style.display = 'block';
-
-            const initialState = document.getElementById('initialState');
-            if (initialState) initialState.style.display = 'none';
 
         } catch (error) {
             console.error('Error:', error);
+            // Drop placeholders of reports that never arrived
+            sankeyDiagram.querySelectorAll('.chart-loading').forEach(el => el.closest('.chart-wrapper')?.remove());
             errorMessage.textContent = error.message;
             errorMessage.style.display = 'block';
         } finally {
@@ -496,6 +685,77 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // --- Precomputed snapshots ---
+    // Bundles written by build_snapshots.py for the default options; the manifest lists what exists
+    const SNAPSHOT_ROOT = '/static/snapshots';
+    let snapshotManifest = null;
+
+    function loadSnapshotManifest() {
+        if (!snapshotManifest) {
+            snapshotManifest = fetch(`${SNAPSHOT_ROOT}/manifest.json`, { cache: 'no-cache' })
+                .then(response => response.ok ? response.json() : null)
+                .then(manifest => (manifest && manifest.version === 1 ? manifest : null))
+                .catch(() => null);
+        }
+        return snapshotManifest;
+    }
+
+    async function loadSnapshot(formData) {
+        try {
+            const manifest = await loadSnapshotManifest();
+            const entry = manifest?.bundles?.[`${formData.symbol}/${formData.period}_${formData.year}`];
+            if (!entry) return null;
+            // Ignore a bundle the build has not rebuilt or re-checked recently (e.g. failing rebuilds)
+            const age = Date.now() - Date.parse(entry.verified_at);
+            if (!(age < manifest.max_age_hours * 3600 * 1000)) return null;
+
+            // built_at in the URL so a rebuilt bundle is never served from the browser cache
+            const response = await fetch(`${SNAPSHOT_ROOT}/${entry.file}?v=${encodeURIComponent(entry.built_at)}`);
+            if (!response.ok) return null;
+
+            let bytes = new Uint8Array(await response.arrayBuffer());
+            // Flask sends .json.gz with Content-Encoding: gzip, so the browser has usually inflated it already
+            if (bytes[0] === 0x1f && bytes[1] === 0x8b) {
+                if (typeof DecompressionStream === 'undefined') return null;
+                const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+                bytes = new Uint8Array(await new Response(stream).arrayBuffer());
+            }
+            const snapshot = JSON.parse(new TextDecoder().decode(bytes));
+            return snapshot.success ? snapshot : null;
+        } catch (error) {
+            console.warn('Snapshot unavailable, using the API:', error);
+            return null;
+        }
+    }
+
+    // --- Server-Sent Events reader ---
+    // EventSource only supports GET, so the stream is read from a POST fetch
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+
+                let event = 'message';
+                const dataLines = [];
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+                });
+                if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+
     // --- Download Handler ---
     downloadBtn.addEventListener('click', () => {
         if (!lastSankeyText) return;
@@ -679,7 +939,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         // --- DRAW TITLE ON SVG ---
         const reportNames = { 'balance': 'Bảng Cân Đối Kế Toán', 'income': 'Báo Cáo Kết Quả Kinh Doanh', 'cashflow': 'Báo Cáo Lưu Chuyển Tiền Tệ' };
-        const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm' };
+        const periodNames = { 'Q1': 'Quý I', 'Q2': 'Quý II', 'Q3': 'Quý III', 'Q4': 'Quý IV', 'year': 'Cả Năm', 'TTM': '12 tháng gần nhất' };
 
         const titleGrp = svg.append("g")
             .attr("transform", `translate(${width / 2}, -60)`)
@@ -0,0 +1,131 @@
+// PNG export worker
+// Receives already-decoded ImageBitmaps from the page, draws them on an OffscreenCanvas
+// and encodes them here, so rasterizing and PNG/zip encoding never block the UI.
+//
+// Message in:  { id, mode: 'png' | 'combined' | 'zip', images: [{ name, bitmap }], gap }
+// Message out: { id, blob } or { id, error }
+
+self.onmessage = async (e) => {
+    const { id, mode, images, gap = 0 } = e.data;
+    try {
+        let blob;
+        if (mode === 'combined') {
+            blob = await combineImages(images.map(img => img.bitmap), gap);
+        } else if (mode === 'zip') {
+            const files = [];
+            for (const img of images) {
+                files.push({ name: img.name, data: new Uint8Array(await (await drawImage(img.bitmap)).arrayBuffer()) });
+            }
+            blob = buildZip(files);
+        } else {
+            blob = await drawImage(images[0].bitmap);
+        }
+        self.postMessage({ id, blob });
+    } catch (err) {
+        self.postMessage({ id, error: err.message || String(err) });
+    } finally {
+        images.forEach(img => img.bitmap.close());
+    }
+};
+
+function drawImage(bitmap) {
+    const canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = 'white';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    ctx.drawImage(bitmap, 0, 0);
+    return canvas.convertToBlob({ type: 'image/png' });
+}
+
+// Stack the diagrams vertically into a single PNG
+function combineImages(bitmaps, gap) {
+    const width = Math.max(...bitmaps.map(b => b.width));
+    const height = bitmaps.reduce((sum, b) => sum + b.height, 0) + gap * (bitmaps.length - 1);
+
+    const canvas = new OffscreenCanvas(width, height);
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = 'white';
+    ctx.fillRect(0, 0, width, height);
+
+    let y = 0;
+    bitmaps.forEach(b => {
+        ctx.drawImage(b, Math.round((width - b.width) / 2), y);
+        y += b.height + gap;
+    });
+    return canvas.convertToBlob({ type: 'image/png' });
+}
+
+// --- Minimal zip writer (stored, no compression: PNG data is already deflated) ---
+const CRC_TABLE = (() => {
+    const table = new Uint32Array(256);
+    for (let n = 0; n < 256; n++) {
+        let c = n;
+        for (let k = 0; k < 8; k++) c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+        table[n] = c >>> 0;
+    }
+    return table;
+})();
+
+function crc32(data) {
+    let crc = 0xFFFFFFFF;
+    for (let i = 0; i < data.length; i++) crc = CRC_TABLE[(crc ^ data[i]) & 0xFF] ^ (crc >>> 8);
+    return (crc ^ 0xFFFFFFFF) >>> 0;
+}
+
+function buildZip(files) {
+    const encoder = new TextEncoder();
+    const now = new Date();
+    const dosTime = (now.getHours() << 11) | (now.getMinutes() << 5) | (now.getSeconds() >> 1);
+    const dosDate = ((now.getFullYear() - 1980) << 9) | ((now.getMonth() + 1) << 5) | now.getDate();
+
+    const parts = [];
+    const central = [];
+    let offset = 0;
+
+    files.forEach(file => {
+        const name = encoder.encode(file.name);
+        const crc = crc32(file.data);
+        const size = file.data.length;
+
+        const local = new DataView(new ArrayBuffer(30));
+        local.setUint32(0, 0x04034B50, true);   // local file header signature
+        local.setUint16(4, 20, true);           // version needed
+        local.setUint16(6, 0x0800, true);       // flags: UTF-8 names
+        local.setUint16(8, 0, true);            // method: stored
+        local.setUint16(10, dosTime, true);
+        local.setUint16(12, dosDate, true);
+        local.setUint32(14, crc, true);
+        local.setUint32(18, size, true);        // compressed size
+        local.setUint32(22, size, true);        // uncompressed size
+        local.setUint16(26, name.length, true);
+        local.setUint16(28, 0, true);           // extra length
+        parts.push(local, name, file.data);
+
+        const entry = new DataView(new ArrayBuffer(46));
+        entry.setUint32(0, 0x02014B50, true);   // central directory signature
+        entry.setUint16(4, 20, true);           // version made by
+        entry.setUint16(6, 20, true);           // version needed
+        entry.setUint16(8, 0x0800, true);
+        entry.setUint16(10, 0, true);
+        entry.setUint16(12, dosTime, true);
+        entry.setUint16(14, dosDate, true);
+        entry.setUint32(16, crc, true);
+        entry.setUint32(20, size, true);
+        entry.setUint32(24, size, true);
+        entry.setUint16(28, name.length, true);
+        entry.setUint32(42, offset, true);      // local header offset (other fields stay 0)
+        central.push(entry, name);
+
+        offset += 30 + name.length + size;
+    });
+
+    const centralSize = central.reduce((sum, part) => sum + part.byteLength, 0);
+    const end = new DataView(new ArrayBuffer(22));
+    end.setUint32(0, 0x06054B50, true);         // end of central directory signature
+    end.setUint16(8, files.length, true);
+    end.setUint16(10, files.length, true);
+    end.setUint32(12, centralSize, true);
+    end.setUint32(16, offset, true);
+
+    return new Blob([...parts, ...central, end], { type: 'application/zip' });
+}
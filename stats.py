@@ -0,0 +1,18 @@
+"""
+Small statistics helpers shared by the command-line tools (batch_export, loadtest)
+Standard library only, so the tools do not import the Flask-side modules
+"""
+
+import math
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile: the smallest sample such that at least pct% of the
+    samples are less than or equal to it. Returns 0.0 for no samples.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
@@ -0,0 +1,11 @@
+import pytest
+
+from derived_periods import statement_period_type
+
+
+@pytest.mark.parametrize('period, expected', [
+    ('year', 'year'), ('YEAR', 'year'), ('nam', 'year'), ('NAM', 'year'), ('yearly', 'year'),
+    ('Q1', 'quarter'), ('Q4', 'quarter'), ('TTM', 'quarter'),
+])
+def test_statement_period_type(period, expected):
+    assert statement_period_type(period) == expected
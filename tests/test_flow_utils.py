@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+
+import pytest
+
+import balance
+from flow_utils import fold_small_flows, parse_flow_options, parse_flows, prune_flows
+from statement import Statement
+
+BALANCE_LABELS = [
+    "TỔNG CỘNG TÀI SẢN", "A. TÀI SẢN NGẮN HẠN", "I. Tiền và các khoản tương đương tiền",
+    "II. Đầu tư tài chính ngắn hạn", "III. Các khoản phải thu ngắn hạn", "IV. Hàng tồn kho",
+    "V. Tài sản ngắn hạn khác", "B. TÀI SẢN DÀI HẠN", "I. Các khoản phải thu dài hạn",
+    "II. Tài sản cố định", "III. Bất động sản đầu tư", "IV. Tài sản dở dang dài hạn",
+    "V. Đầu tư tài chính dài hạn", "VI. Tài sản dài hạn khác", "C. NỢ PHẢI TRẢ", "I. Nợ ngắn hạn",
+    "1. Phải trả người bán ngắn hạn", "2. Người mua trả tiền trước ngắn hạn",
+    "3. Thuế và các khoản phải nộp Nhà nước", "4. Phải trả người lao động",
+    "5. Chi phí phải trả ngắn hạn", "9. Phải trả ngắn hạn khác",
+    "10. Vay và nợ thuê tài chính ngắn hạn", "12. Quỹ khen thưởng, phúc lợi", "II. Nợ dài hạn",
+    "8. Vay và nợ thuê tài chính dài hạn", "D. VỐN CHỦ SỞ HỮU", "1. Vốn góp của chủ sở hữu",
+    "2. Thặng dư vốn cổ phần", "5. Cổ phiếu quỹ", "8. Quỹ đầu tư phát triển",
+    "11. Lợi nhuận sau thuế chưa phân phối", "13. Lợi ích cổ đông không kiểm soát",
+    "TỔNG CỘNG NGUỒN VỐN",
+]
+
+
+def balance_statement(seed):
+    rng = random.Random(seed)
+    values = [rng.randint(1, 50_000) * 1_000_000_000 for _ in BALANCE_LABELS]
+    return Statement.from_rows(BALANCE_LABELS, ('2024',), [values])
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('max_flows', [2, 3, 4, 5])
+def test_threshold_and_max_flows_give_one_flow_per_pair(seed, max_flows):
+    extract_params, max_flows, _ = parse_flow_options(
+        {'threshold': 0.5, 'unit': 'million', 'max_flows_per_node': max_flows})
+    text = prune_flows(balance.extract_flows_from_dataframe(balance_statement(seed), **extract_params), max_flows)
+
+    pairs = Counter((source, target) for source, _, target in parse_flows(text))
+    assert [pair for pair, count in pairs.items() if count > 1] == []
+
+
+def test_prune_adds_overflow_to_existing_other_flow():
+    flows = fold_small_flows([
+        ("A", 100, "x1"), ("A", 90, "x2"), ("A", 80, "x3"),
+        ("A", 5, "s1"), ("A", 4, "s2"),
+    ], threshold_value=10)
+    assert ("A", 9, "Khác (A)") in flows
+
+    text = prune_flows("\n".join(f"{s} [{v}] {t}" for s, v, t in flows), 3)
+    assert parse_flows(text) == [("A", 100.0, "x1"), ("A", 90.0, "x2"), ("A", 89.0, "Khác (A)")]
+
+
+def test_inflows_and_outflows_of_a_node_fold_into_separate_nodes():
+    flows = [
+        ("o1", 100, "X"), ("o2", 3, "X"), ("o3", 2, "X"),
+        ("X", 95, "e1"), ("X", 6, "e2"), ("X", 4, "e3"),
+    ]
+    folded = fold_small_flows(flows, threshold_value=10)
+    assert ("Khác (nguồn X)", 5, "X") in folded
+    assert ("X", 10, "Khác (X)") in folded
+
+    text = "\n".join(f"{s} [{v}] {t}" for s, v, t in flows + [("o4", 1, "X"), ("X", 1, "e4")])
+    pairs = {(source, target) for source, _, target in parse_flows(prune_flows(text, 2))}
+    assert not any((target, source) in pairs for source, target in pairs)
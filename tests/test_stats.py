@@ -0,0 +1,8 @@
+from stats import percentile
+
+
+def test_percentile_is_nearest_rank():
+    samples = [15, 20, 35, 40, 50]
+    assert [percentile(samples, pct) for pct in (0, 5, 30, 40, 50, 100)] == [15, 15, 20, 20, 35, 50]
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([], 50) == 0.0